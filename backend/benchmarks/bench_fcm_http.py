@@ -0,0 +1,140 @@
+"""
+Benchmark: async FCM HTTP v1 client against a local HTTP/2 stub
+
+Starts a stub FCM server in a separate process (h2c, OAuth token +
+messages:send endpoints, fixed per-request latency) and sends the same messages through FCMHttpClient one
+at a time (what a per-message SDK send does) and pipelined over HTTP/2.
+
+Run from the backend directory:
+    python benchmarks/bench_fcm_http.py [message_count] [latency_ms]
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from firebase_admin import messaging
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.events import ConnectionTerminated, DataReceived, RequestReceived, StreamEnded
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from utils.fcm_http import FCMHttpClient  # noqa: E402
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+class StubFCMProtocol(asyncio.Protocol):
+    """Minimal h2c server answering every stream after a fixed delay."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.conn = H2Connection(config=H2Configuration(client_side=False))
+        self.paths = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, RequestReceived):
+                self.paths[event.stream_id] = dict(event.headers)[b":path"].decode()
+            elif isinstance(event, DataReceived):
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, StreamEnded):
+                asyncio.get_running_loop().create_task(self.respond(event.stream_id))
+            elif isinstance(event, ConnectionTerminated):
+                self.transport.close()
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id: int):
+        path = self.paths.pop(stream_id)
+        if path == "/token":
+            body = {"access_token": "stub-token", "expires_in": 3600, "token_type": "Bearer"}
+        else:
+            await asyncio.sleep(self.latency)
+            body = {"name": f"projects/bench/messages/{stream_id}"}
+        payload = json.dumps(body).encode()
+        self.conn.send_headers(stream_id, [
+            (":status", "200"), ("content-type", "application/json"), ("content-length", str(len(payload)))
+        ])
+        self.conn.send_data(stream_id, payload, end_stream=True)
+        self.transport.write(self.conn.data_to_send())
+
+
+def run_stub(latency: float, ready):
+    """Stub server process (keeps its h2 work off the client's event loop)."""
+    async def serve():
+        server = await asyncio.get_running_loop().create_server(lambda: StubFCMProtocol(latency), HOST, PORT)
+        ready.set()
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def make_service_account() -> dict:
+    """Throwaway service account with a fresh RSA key (the stub never checks it)."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    return {
+        "project_id": "bench",
+        "client_email": "bench@bench.iam.gserviceaccount.com",
+        "private_key_id": "bench",
+        "private_key": pem
+    }
+
+
+async def measure(label: str, client: FCMHttpClient, messages: list) -> float:
+    start = time.perf_counter()
+    errors = await client.send_each(messages, timeout=30)
+    elapsed = time.perf_counter() - start
+    failed = sum(error is not None for error in errors)
+    print(f"{label:<36} {elapsed * 1000:9.1f} ms  {len(messages) / elapsed:9.0f} msg/s  ({failed} failed)")
+    return elapsed
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    ready = multiprocessing.Event()
+    stub = multiprocessing.Process(target=run_stub, args=(latency, ready), daemon=True)
+    stub.start()
+    ready.wait(10)
+
+    base_url = f"http://{HOST}:{PORT}"
+    account = make_service_account()
+    messages = [
+        messaging.Message(data={"title": "Task Reminder", "body": f"Task {i}"}, token=f"token-{i}")
+        for i in range(count)
+    ]
+    print(f"Sending {count} messages to a stub with {latency * 1000:.0f} ms latency per request")
+
+    sequential = FCMHttpClient(account, base_url=base_url, token_url=f"{base_url}/token", concurrency=1)
+    pipelined = FCMHttpClient(account, base_url=base_url, token_url=f"{base_url}/token")
+    try:
+        # Warm up: OAuth token fetch and connection setup are not measured
+        await sequential.send_each(messages[:1])
+        await pipelined.send_each(messages[:1])
+        before = await measure("one request at a time", sequential, messages[:max(1, count // 10)])
+        before *= count / max(1, count // 10)
+        print(f"{'  (extrapolated to all messages)':<36} {before * 1000:9.1f} ms")
+        after = await measure(f"pipelined (concurrency={pipelined.concurrency})", pipelined, messages)
+        print(f"speedup: {before / after:.1f}x")
+    finally:
+        await sequential.close()
+        await pipelined.close()
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
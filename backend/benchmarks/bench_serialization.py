@@ -0,0 +1,82 @@
+"""
+Benchmark: serialization cost of a 5k-task GET /tasks response
+
+Compares the old path (per-row dict copy, response_model=list[dict]
+validation + jsonable_encoder, stdlib JSONResponse) with the new one
+(rows passed straight to json_response, orjson when installed).
+
+Run from the backend directory:
+    python benchmarks/bench_serialization.py [task_count]
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from utils.responses import ORJSON_AVAILABLE, json_response  # noqa: E402
+
+ROUNDS = 20
+
+
+def make_tasks(count: int) -> list[dict]:
+    """Rows shaped like PostgREST output for the tasks table."""
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": "9f1c2b7e-0000-4000-8000-000000000000",
+            "name": f"Task number {i}",
+            "start_time": "09:00:00",
+            "end_time": "10:30:00",
+            "category": "Work",
+            "priority": ("High", "Medium", "Low")[i % 3],
+            "completed": i % 2 == 0,
+            "is_late": False,
+            "created_at": date.today().isoformat(),
+            "updated_at": now
+        }
+        for i in range(count)
+    ]
+
+
+async def old_path(rows: list[dict], field) -> bytes:
+    tasks = [{**task, "id": str(task["id"])} for task in rows]
+    content = await serialize_response(field=field, response_content=tasks)
+    return JSONResponse(content).body
+
+
+async def new_path(rows: list[dict], field) -> bytes:
+    return json_response(rows).body
+
+
+async def measure(label: str, func, rows: list[dict], field) -> float:
+    body = await func(rows, field)
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        await func(rows, field)
+    elapsed_ms = (time.perf_counter() - start) / ROUNDS * 1000
+    print(f"{label:<48} {elapsed_ms:8.2f} ms/response  ({len(body) / 1024:.0f} KiB)")
+    return elapsed_ms
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rows = make_tasks(count)
+    field = create_model_field("Response_get_tasks", list[dict], mode="serialization")
+
+    print(f"Serializing {count} tasks, {ROUNDS} rounds (orjson available: {ORJSON_AVAILABLE})")
+    before = await measure("before: copy + list[dict] validation + stdlib", old_path, rows, field)
+    after = await measure("after: json_response (no copy/validation)", new_path, rows, field)
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,20 +2,34 @@ import os
 import logging
 from contextlib import asynccontextmanager
 from datetime import datetime, time, timedelta
+from time import perf_counter
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import Response
 from dotenv import load_dotenv
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 
 # Fixed imports - remove 'backend.' prefix for deployment
 from routes.tasks import router as tasks_router
-from utils.auth_utils import verify_token
+from utils.auth_utils import verify_token, get_auth_cache_stats
+from utils.jwks import jwks_cache
 from routes.fcm import router as fcm_router
-from utils.fcm_service import initialize_firebase, send_task_reminder
+from utils.fcm_service import initialize_firebase, build_task_reminder, build_task_digest, send_notifications_batched, retry_queue
 from utils.supabase_client import supabase
 from routes.contact import router as contact_router
+from utils.task_cache import get_task_cache_stats
+from utils.idempotency import get_idempotency_stats
+from utils.reminder_index import reminder_index
+from utils.scheduler_leases import shard_coordinator, REMINDER_LEASE_RENEW_SECONDS
+from utils.notification_dedup import dedup_store, claim_reminders, mark_notified, get_dedup_stats
+from utils.token_usage import last_used_buffer, FCM_LAST_USED_FLUSH_SECONDS
+from utils.fcm_executor import fcm_executor
+from utils.fcm_http import fcm_http_client
+from utils.display_names import get_display_names, refresh_changed_display_names, get_display_name_stats, DISPLAY_NAME_REFRESH_SECONDS
+from utils.responses import DefaultJSONResponse
+from utils.compression import CompressionMiddleware
 
 
 import logging
@@ -38,82 +52,75 @@ load_dotenv()
 # Global scheduler instance
 scheduler = None
 
-# Global notification cache to prevent spam (key: task_id_user_id, value: timestamp)
-recent_notifications = {}
+# Cap on each FCM batch call of a reminder run
+REMINDER_SEND_TIMEOUT = float(os.getenv("REMINDER_SEND_TIMEOUT", "15"))
 
-def clean_notification_cache():
-    """Clean old entries from notification cache (older than 15 minutes)"""
-    global recent_notifications
-    cutoff = datetime.now() - timedelta(minutes=15)
-    cutoff_timestamp = cutoff.timestamp()
-    
-    keys_to_remove = [
-        key for key, timestamp in recent_notifications.items() 
-        if timestamp < cutoff_timestamp
-    ]
-    
-    for key in keys_to_remove:
-        del recent_notifications[key]
-    
-    if keys_to_remove:
-        logger.debug(f"Cleaned {len(keys_to_remove)} old notification cache entries")
-
-def has_recent_notification(task_id: str, user_id: str) -> bool:
-    """Check if we've sent a notification for this task recently"""
-    cache_key = f"{task_id}_{user_id}"
-    if cache_key in recent_notifications:
-        # Check if it's within the last 10 minutes
-        time_diff = datetime.now().timestamp() - recent_notifications[cache_key]
-        return time_diff < 10 * 60  # 10 minutes in seconds
-    return False
-
-def mark_notification_sent(task_id: str, user_id: str):
-    """Mark that we've sent a notification for this task"""
-    cache_key = f"{task_id}_{user_id}"
-    recent_notifications[cache_key] = datetime.now().timestamp()
-
-async def get_user_display_name(user_id: str) -> str:
+# Merge each user's due tasks of a run into one push instead of one per task
+REMINDER_DIGEST_MODE = os.getenv("REMINDER_DIGEST_MODE", "false").lower() == "true"
+
+# Totals and wall-clock of the last reminder run (shown on /health)
+last_reminder_run = {}
+
+async def fetch_upcoming_tasks_from_db(start_window: datetime, end_window: datetime) -> list:
     """
-    Get user's display name from Supabase auth.users table or profiles table.
-    Falls back to 'you' if not found.
+    Range query for incomplete tasks starting inside the window.
+
+    Only used while the reminder index is not loaded.
     """
-    try:
-        # First, try to get from profiles table
-        profiles_response = supabase.table("profiles").select("full_name, display_name").eq("id", user_id).execute()
-        
-        if profiles_response.data and len(profiles_response.data) > 0:
-            profile = profiles_response.data[0]
-            name = profile.get("display_name") or profile.get("full_name")
+    start_time_str = start_window.time().strftime("%H:%M:%S")
+    end_time_str = end_window.time().strftime("%H:%M:%S")
 
-            if name:
-                return name.strip()
+    # ✅ FIXED: Removed created_at filter - check ALL non-completed tasks
+    if start_window.date() == end_window.date():
+        # Same day - simple range query
+        tasks_response = await supabase.table("tasks").select(
+            "id, user_id, name, start_time, priority, created_at"
+        ).eq(
+            "completed", False
+        ).gte(
+            "start_time", start_time_str
+        ).lte(
+            "start_time", end_time_str
+        ).not_.is_(
+            "user_id", "null"  # Only authenticated users
+        ).execute()
         
-        # Option 2: Try auth.users table (may require RLS bypass)
-        users_response = supabase.table("auth.users").select("email, raw_user_meta_data").eq("id", user_id).execute()
+        upcoming_tasks = tasks_response.data or []
         
-        if users_response.data and len(users_response.data) > 0:
-            user = users_response.data[0]
-            
-            # Try metadata first
-            metadata = user.get("raw_user_meta_data") or {}
-            name = (
-                metadata.get("full_name") or 
-                metadata.get("name") or 
-                metadata.get("first_name")
-            )
-            if name:
-                return name.strip()
-            
-            # Fall back to email username
-            email = user.get("email")
-            if email:
-                return email.split("@")[0]
+    else:
+        # Midnight crossover - need two queries
+        logger.debug("Handling midnight crossover in time window")
         
-    except Exception as e:
-        logger.warning(f"Could not fetch user display name for {user_id}: {str(e)}")
-    
-    # Final fallback
-    return "you"
+        # Query for tasks before midnight
+        tasks_response_1 = await supabase.table("tasks").select(
+            "id, user_id, name, start_time, priority, created_at"
+        ).eq(
+            "completed", False
+        ).gte(
+            "start_time", start_time_str
+        ).lte(
+            "start_time", "23:59:59"
+        ).not_.is_(
+            "user_id", "null"
+        ).execute()
+        
+        # Query for tasks after midnight
+        tasks_response_2 = await supabase.table("tasks").select(
+            "id, user_id, name, start_time, priority, created_at"
+        ).eq(
+            "completed", False
+        ).gte(
+            "start_time", "00:00:00"
+        ).lte(
+            "start_time", end_time_str
+        ).not_.is_(
+            "user_id", "null"
+        ).execute()
+        
+        # Combine results
+        upcoming_tasks = (tasks_response_1.data or []) + (tasks_response_2.data or [])
+
+    return upcoming_tasks
 
 async def check_upcoming_tasks():
     """
@@ -124,80 +131,40 @@ async def check_upcoming_tasks():
     try:
         logger.info("Running scheduled task reminder check...")
         
-        # Clean old notification cache entries
-        clean_notification_cache()
-        
-        # Get current time
+        # Get current time, truncated to the minute: ticks fire on the minute
+        # on every replica, so a late tick still checks the same window
         now = datetime.now()
         current_date = now.date()
-        current_datetime = now
+        current_datetime = now.replace(second=0, microsecond=0)
         
         # Calculate time window (9.5 to 10.5 minutes from now)
         start_window = current_datetime + timedelta(minutes=9, seconds=30)
         end_window = current_datetime + timedelta(minutes=10, seconds=30)
         
-        # Convert to time strings for database query
+        # Time strings for logging
         start_time_str = start_window.time().strftime("%H:%M:%S")
         end_time_str = end_window.time().strftime("%H:%M:%S")
         
         logger.debug(f"Checking for tasks between {start_time_str} and {end_time_str}")
         
-        upcoming_tasks = []
+        if reminder_index.ready:
+            # Steady state: served from the in-memory index after a delta read
+            # of writes made outside this process (other workers, supabase-js)
+            try:
+                await reminder_index.resync()
+            except Exception as e:
+                logger.error(f"Reminder index resync failed, checking the index as is: {str(e)}")
+            upcoming_tasks = reminder_index.due(start_window, end_window)
+        else:
+            # Index failed to load at startup; fall back to the range query
+            try:
+                upcoming_tasks = await fetch_upcoming_tasks_from_db(start_window, end_window)
+            except Exception as e:
+                logger.error(f"Supabase error fetching upcoming tasks: {str(e)}")
+                return
         
-        try:
-            # ✅ FIXED: Removed created_at filter - check ALL non-completed tasks
-            if start_window.date() == end_window.date():
-                # Same day - simple range query
-                tasks_response = supabase.table("tasks").select(
-                    "id, user_id, name, start_time, priority, created_at"
-                ).eq(
-                    "completed", False
-                ).gte(
-                    "start_time", start_time_str
-                ).lte(
-                    "start_time", end_time_str
-                ).not_.is_(
-                    "user_id", "null"  # Only authenticated users
-                ).execute()
-                
-                upcoming_tasks = tasks_response.data or []
-                
-            else:
-                # Midnight crossover - need two queries
-                logger.debug("Handling midnight crossover in time window")
-                
-                # Query for tasks before midnight
-                tasks_response_1 = supabase.table("tasks").select(
-                    "id, user_id, name, start_time, priority, created_at"
-                ).eq(
-                    "completed", False
-                ).gte(
-                    "start_time", start_time_str
-                ).lte(
-                    "start_time", "23:59:59"
-                ).not_.is_(
-                    "user_id", "null"
-                ).execute()
-                
-                # Query for tasks after midnight
-                tasks_response_2 = supabase.table("tasks").select(
-                    "id, user_id, name, start_time, priority, created_at"
-                ).eq(
-                    "completed", False
-                ).gte(
-                    "start_time", "00:00:00"
-                ).lte(
-                    "start_time", end_time_str
-                ).not_.is_(
-                    "user_id", "null"
-                ).execute()
-                
-                # Combine results
-                upcoming_tasks = (tasks_response_1.data or []) + (tasks_response_2.data or [])
-                
-        except Exception as e:
-            logger.error(f"Supabase error fetching upcoming tasks: {str(e)}")
-            return
+        # Only users in the shards this replica currently leases
+        upcoming_tasks = [task for task in upcoming_tasks if shard_coordinator.owns_user(task["user_id"])]
         
         if not upcoming_tasks:
             logger.debug("No upcoming tasks found")
@@ -205,19 +172,12 @@ async def check_upcoming_tasks():
             
         logger.info(f"Found {len(upcoming_tasks)} upcoming tasks")
         
-        # Group tasks by user_id and filter out recent notifications
+        # Claim the reminders (drops recent notifications), then group tasks by user_id
+        upcoming_tasks, filtered_count = await claim_reminders(upcoming_tasks)
         users_with_tasks = {}
-        filtered_count = 0
         
         for task in upcoming_tasks:
             user_id = task["user_id"]
-            task_id = task["id"]
-            
-            # Check if we've sent a notification for this task recently
-            if has_recent_notification(str(task_id), user_id):
-                logger.debug(f"Skipping task {task_id} - notification sent recently")
-                filtered_count += 1
-                continue
             
             if user_id not in users_with_tasks:
                 users_with_tasks[user_id] = []
@@ -230,49 +190,74 @@ async def check_upcoming_tasks():
             logger.debug("No tasks remaining after filtering recent notifications")
             return
         
-        # Send notifications to each user
-        total_sent = 0
-        total_failed = 0
-        
-        for user_id, user_tasks in users_with_tasks.items():
-            try:
-                # Get user's display name
-                user_name = await get_user_display_name(user_id)
-                
-                # Send notification for each task
-                for task in user_tasks:
-                    task_name = task["name"]
-                    priority = task.get("priority") or "Medium"
-                    task_id = str(task["id"])
-                    
-                    try:
-                        # Send the notification
-                        success = await send_task_reminder(
-                            user_id=user_id,
-                            task_name=task_name,
-                            priority=priority,
-                            user_name=user_name
-                        )
-                        
-                        if success:
-                            total_sent += 1
-                            mark_notification_sent(task_id, user_id)
-                            logger.info(f"✅ Sent task reminder '{task_name}' to user {user_id}")
-                        else:
-                            total_failed += 1
-                            logger.warning(f"❌ Failed to send task reminder '{task_name}' to user {user_id}")
-                            
-                    except Exception as task_error:
-                        total_failed += 1
-                        logger.error(f"Error sending notification for task '{task_name}' to user {user_id}: {str(task_error)}")
-                        
-            except Exception as user_error:
-                total_failed += len(user_tasks)
-                logger.error(f"Error processing tasks for user {user_id}: {str(user_error)}")
-                continue
+        totals = {"sent": 0, "failed": 0, "timed_out": 0, "retrying": 0}
+        run_started = perf_counter()
+
+        # One cached/batched name lookup, then every reminder of the run goes
+        # out in batched send_each calls
+        user_names = await get_display_names(users_with_tasks)
+
+        if REMINDER_DIGEST_MODE:
+            # One notification per user, so FCM calls scale with users
+            reminders = [
+                (user_id, user_tasks, build_task_digest(
+                    user_id=user_id,
+                    tasks=user_tasks,
+                    user_name=user_names.get(user_id, "you")
+                ))
+                for user_id, user_tasks in users_with_tasks.items()
+            ]
+        else:
+            reminders = [
+                (user_id, [task], build_task_reminder(
+                    user_id=user_id,
+                    task_name=task["name"],
+                    priority=task.get("priority") or "Medium",
+                    user_name=user_names.get(user_id, "you"),
+                    task_id=task["id"]
+                ))
+                for user_id, user_tasks in users_with_tasks.items()
+                for task in user_tasks
+            ]
+        results = await send_notifications_batched(
+            # tasks: marked notified by the retry queue if a failed send goes through later
+            [{**notification, "tasks": tasks} for _, tasks, notification in reminders],
+            timeout=REMINDER_SEND_TIMEOUT
+        )
+
+        delivered = []
+        for (user_id, tasks, _), result in zip(reminders, results):
+            label = f"'{tasks[0]['name']}'" if len(tasks) == 1 else f"digest of {len(tasks)} tasks"
+            if result["sent"] > 0:
+                totals["sent"] += 1
+                delivered.extend(tasks)
+                logger.info(f"✅ Sent task reminder {label} to user {user_id}")
+            else:
+                totals["failed"] += 1
+                if result["timed_out"]:
+                    totals["timed_out"] += 1
+                if result["retrying"]:
+                    totals["retrying"] += 1
+                logger.warning(f"❌ Failed to send task reminder {label} to user {user_id}")
+
+        await mark_notified(delivered)
+
+        duration = perf_counter() - run_started
+        last_reminder_run.update(
+            finished_at=datetime.now().isoformat(),
+            duration_seconds=round(duration, 3),
+            users=len(users_with_tasks),
+            tasks=sum(len(user_tasks) for user_tasks in users_with_tasks.values()),
+            notifications=len(reminders),
+            digest_mode=REMINDER_DIGEST_MODE,
+            **totals
+        )
         
-        if total_sent > 0 or total_failed > 0:
-            logger.info(f"Task reminder check completed: ✅ {total_sent} sent, ❌ {total_failed} failed, 👥 {len(users_with_tasks)} users")
+        if totals["sent"] > 0 or totals["failed"] > 0:
+            logger.info(
+                f"Task reminder check completed in {duration:.2f}s: ✅ {totals['sent']} sent, "
+                f"❌ {totals['failed']} failed ({totals['timed_out']} timed out, {totals['retrying']} queued for retry), 👥 {len(users_with_tasks)} users"
+            )
         else:
             logger.debug("Task reminder check completed - no notifications sent")
         
@@ -287,29 +272,55 @@ def start_scheduler():
     try:
         scheduler = AsyncIOScheduler()
         
-        # Schedule the task reminder check to run every 60 seconds
+        # Schedule the task reminder check at the start of every minute
+        # (wall-clock aligned, so all replicas check the same windows). The
+        # first run is an initial check shortly after startup; being the same
+        # job, it can never overlap a regular tick.
         scheduler.add_job(
             check_upcoming_tasks,
-            trigger=IntervalTrigger(seconds=60),
+            trigger=CronTrigger(second=0),
             id="task_reminder_check",
             name="Check for upcoming tasks and send FCM notifications",
             replace_existing=True,
             max_instances=1,  # Prevent overlapping runs
-            misfire_grace_time=30  # Allow 30s grace period for missed runs
+            misfire_grace_time=30,  # Allow 30s grace period for missed runs
+            next_run_time=datetime.now() + timedelta(seconds=10)
         )
         
-        scheduler.start()
-        logger.info("🔔 FCM notification scheduler started - checking every 60 seconds")
+        # Keep this replica's reminder shard leases renewed
+        if shard_coordinator.store is not None:
+            scheduler.add_job(
+                shard_coordinator.heartbeat,
+                trigger=IntervalTrigger(seconds=REMINDER_LEASE_RENEW_SECONDS),
+                id="reminder_lease_heartbeat",
+                name="Renew reminder shard leases",
+                replace_existing=True,
+                max_instances=1
+            )
         
-        # Run initial check after a brief delay
+        # Invalidate cached display names after profile edits
         scheduler.add_job(
-            check_upcoming_tasks,
-            trigger='date',
-            run_date=datetime.now() + timedelta(seconds=10),
-            id="initial_task_check",
-            name="Initial task reminder check"
+            refresh_changed_display_names,
+            trigger=IntervalTrigger(seconds=DISPLAY_NAME_REFRESH_SECONDS),
+            id="display_name_refresh",
+            name="Refresh display names of changed profiles",
+            replace_existing=True,
+            max_instances=1
+        )
+        
+        # Write buffered fcm_tokens.last_used timestamps in bulk
+        scheduler.add_job(
+            last_used_buffer.flush,
+            trigger=IntervalTrigger(seconds=FCM_LAST_USED_FLUSH_SECONDS),
+            id="fcm_last_used_flush",
+            name="Flush buffered FCM token last_used updates",
+            replace_existing=True,
+            max_instances=1
         )
         
+        scheduler.start()
+        logger.info("🔔 FCM notification scheduler started - checking at the start of every minute")
+        
     except Exception as e:
         logger.error(f"Failed to start scheduler: {str(e)}")
 
@@ -328,6 +339,27 @@ def stop_scheduler():
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup code
+    # Open the shared Supabase connection pool before anything queries it
+    supabase.open()
+
+    # Load JWT signing keys before the first request; refreshed in the background
+    await jwks_cache.start()
+
+    # Load pending reminders once; the reminder job falls back to DB queries if this fails
+    try:
+        await reminder_index.load()
+    except Exception as e:
+        logger.error(f"Failed to load reminder index: {str(e)}")
+
+    # Reload recently sent reminders so a restart does not repeat them
+    try:
+        await dedup_store.open()
+    except Exception as e:
+        logger.error(f"Failed to open notification dedup store: {str(e)}")
+
+    # Claim reminder shards before the first check runs
+    await shard_coordinator.heartbeat()
+
     try:
         # Initialize Firebase first
         initialize_firebase()
@@ -346,6 +378,16 @@ async def lifespan(app: FastAPI):
     try:
         # Stop the scheduler gracefully
         stop_scheduler()
+        await retry_queue.stop()
+        await last_used_buffer.close()
+        fcm_executor.shutdown()
+        await fcm_http_client.close()
+        await shard_coordinator.release()
+        await dedup_store.close()
+        await jwks_cache.stop()
+
+        # Close pooled Supabase connections after the last job has finished
+        await supabase.close()
         logger.info("🛑 Application shutdown completed")
     except Exception as e:
         logger.error(f"Error during shutdown: {str(e)}")
@@ -355,7 +397,8 @@ app = FastAPI(
     title="GetItDone API",
     description="Task management API with FCM notifications",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=DefaultJSONResponse
 )
 
 # Updated CORS for production deployment
@@ -371,6 +414,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for JSON responses (added last so it wraps CORS and every route)
+app.add_middleware(CompressionMiddleware)
+
 # Log that the app started
 logger.info("🚀 FastAPI application starting...")
 
@@ -405,16 +451,25 @@ async def health_check():
     except Exception:
         firebase_status = "error"
     
-    # Get notification cache stats
-    cache_size = len(recent_notifications)
-    
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "services": {
             "scheduler": scheduler_status,
             "firebase": firebase_status,
-            "notification_cache": cache_size
+            "notification_cache": get_dedup_stats(),
+            "task_cache": get_task_cache_stats(),
+            "auth_cache": get_auth_cache_stats(),
+            "idempotency_cache": get_idempotency_stats(),
+            "jwks": jwks_cache.stats(),
+            "reminder_index": reminder_index.stats(),
+            "last_reminder_run": last_reminder_run,
+            "display_names": get_display_name_stats(),
+            "reminder_shards": shard_coordinator.stats(),
+            "fcm_retry_queue": retry_queue.stats(),
+            "fcm_last_used": last_used_buffer.stats(),
+            "fcm_executor": fcm_executor.stats(),
+            "fcm_http": fcm_http_client.stats()
         }
     }
 
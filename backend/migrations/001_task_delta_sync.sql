@@ -0,0 +1,52 @@
+-- Delta sync support for GET /tasks?since=<cursor>
+-- Every write to tasks bumps updated_at, and every delete leaves a tombstone,
+-- so clients can fetch only what changed since their last sync. Triggers are
+-- used (instead of setting values in the API) because the frontend also
+-- writes to tasks directly through supabase-js.
+
+ALTER TABLE tasks
+    ADD COLUMN IF NOT EXISTS updated_at timestamptz NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS tasks_user_id_updated_at_idx
+    ON tasks (user_id, updated_at);
+
+CREATE OR REPLACE FUNCTION tasks_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_touch_updated_at ON tasks;
+CREATE TRIGGER tasks_touch_updated_at
+    BEFORE INSERT OR UPDATE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_touch_updated_at();
+
+CREATE TABLE IF NOT EXISTS task_tombstones (
+    task_id    uuid PRIMARY KEY,
+    user_id    uuid NOT NULL,
+    deleted_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS task_tombstones_user_id_deleted_at_idx
+    ON task_tombstones (user_id, deleted_at);
+
+CREATE OR REPLACE FUNCTION tasks_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    IF OLD.user_id IS NOT NULL THEN
+        INSERT INTO task_tombstones (task_id, user_id, deleted_at)
+        VALUES (OLD.id, OLD.user_id, now())
+        ON CONFLICT (task_id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    END IF;
+    RETURN OLD;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tasks_record_tombstone ON tasks;
+CREATE TRIGGER tasks_record_tombstone
+    AFTER DELETE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION tasks_record_tombstone();
+
+-- Tombstones older than the API's TOMBSTONE_RETENTION_DAYS (30) can be purged;
+-- clients holding an older cursor get a full resync instead.
+-- DELETE FROM task_tombstones WHERE deleted_at < now() - interval '30 days';
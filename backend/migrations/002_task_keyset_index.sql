@@ -0,0 +1,6 @@
+-- Keyset pagination for GET /tasks?limit=&cursor= and NDJSON streaming.
+-- Pages are fetched with user_id = ? AND id > ? ORDER BY id LIMIT ?, which
+-- this index serves without sorting or scanning earlier pages.
+
+CREATE INDEX IF NOT EXISTS tasks_user_id_id_idx
+    ON tasks (user_id, id);
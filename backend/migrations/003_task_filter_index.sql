@@ -0,0 +1,6 @@
+-- Server-side filtering for GET /tasks?created_from=&created_to=.
+-- Date-range dashboard loads filter on user_id + created_at; other filters
+-- (completed, category, priority) are applied to that narrowed row set.
+
+CREATE INDEX IF NOT EXISTS tasks_user_id_created_at_idx
+    ON tasks (user_id, created_at);
@@ -0,0 +1,10 @@
+-- Per-minute reminder index delta (utils/reminder_index.py resync).
+-- Every reminder tick reads the rows changed or deleted since the previous
+-- tick across all users: updated_at >= $1 / deleted_at >= $1. The delta sync
+-- indexes from 001 lead with user_id, so these need their own.
+
+CREATE INDEX IF NOT EXISTS tasks_updated_at_idx
+    ON tasks (updated_at);
+
+CREATE INDEX IF NOT EXISTS task_tombstones_deleted_at_idx
+    ON task_tombstones (deleted_at);
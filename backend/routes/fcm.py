@@ -5,7 +5,8 @@ from typing import Optional, List
 from datetime import datetime
 from utils.supabase_client import supabase
 from utils.auth_utils import verify_token
-from utils.fcm_service import cleanup_invalid_tokens
+from utils.fcm_service import cleanup_invalid_tokens, allow_token
+from utils.responses import json_response
 
 # Set up module-level logger
 logger = logging.getLogger(__name__)
@@ -28,6 +29,9 @@ class FCMTokenResponse(BaseModel):
     last_used: str
     is_active: bool
 
+# Columns returned by GET /tokens (matches FCMTokenResponse)
+FCM_TOKEN_COLUMNS = "id, user_id, token, device_id, device_name, created_at, last_used, is_active"
+
 class FCMCleanupResponse(BaseModel):
     removed_tokens: int
     message: str
@@ -53,7 +57,7 @@ async def register_fcm_token(
         
         try:
             # Check if device already has a token
-            existing_device = supabase.table("fcm_tokens").select("*").eq(
+            existing_device = await supabase.table("fcm_tokens").select("*").eq(
                 "device_id", token_data.device_id
             ).eq("user_id", user_id).execute()
         except Exception as e:
@@ -73,7 +77,7 @@ async def register_fcm_token(
             }
             
             try:
-                result = supabase.table("fcm_tokens").update(update_payload).eq(
+                result = await supabase.table("fcm_tokens").update(update_payload).eq(
                     "device_id", token_data.device_id
                 ).eq("user_id", user_id).execute()
                 
@@ -96,7 +100,7 @@ async def register_fcm_token(
         else:
             # Check if token already exists with different device
             try:
-                existing_token = supabase.table("fcm_tokens").select("*").eq(
+                existing_token = await supabase.table("fcm_tokens").select("*").eq(
                     "token", token_data.token
                 ).execute()
             except Exception as e:
@@ -117,7 +121,7 @@ async def register_fcm_token(
                 }
                 
                 try:
-                    result = supabase.table("fcm_tokens").update(update_payload).eq(
+                    result = await supabase.table("fcm_tokens").update(update_payload).eq(
                         "token", token_data.token
                     ).execute()
                     
@@ -144,7 +148,7 @@ async def register_fcm_token(
                 }
                 
                 try:
-                    result = supabase.table("fcm_tokens").insert(insert_payload).execute()
+                    result = await supabase.table("fcm_tokens").insert(insert_payload).execute()
                     
                     if not result.data or not result.data[0].get("id"):
                         raise HTTPException(
@@ -162,6 +166,9 @@ async def register_fcm_token(
                         detail="Failed to register FCM token"
                     )
         
+        # The token is active again; let sends use it even if it was rejected before
+        allow_token(token_data.token)
+
         # Convert IDs to strings for JSON serialization
         response["id"] = str(response["id"])
         response["user_id"] = str(response["user_id"])
@@ -204,7 +211,7 @@ async def unregister_fcm_token(
         elif token_data.token:
             query = query.eq("token", token_data.token)
         
-        result = query.execute()
+        result = await query.execute()
         
         if not result.data:
             raise HTTPException(
@@ -236,25 +243,12 @@ async def get_user_fcm_tokens(user_id: str = Depends(verify_token)):
     Useful for admin/debugging purposes.
     """
     try:
-        result = supabase.table("fcm_tokens").select("*").eq("user_id", user_id).eq("is_active", True).execute()
-        
-        tokens = []
-        for token_record in result.data:
-            # Convert UUIDs to strings and ensure proper format
-            token_response = {
-                "id": str(token_record["id"]),
-                "user_id": str(token_record["user_id"]),
-                "token": token_record["token"],
-                "device_id": token_record["device_id"],
-                "device_name": token_record.get("device_name"),
-                "created_at": token_record["created_at"],
-                "last_used": token_record["last_used"],
-                "is_active": token_record["is_active"]
-            }
-            tokens.append(token_response)
-        
+        result = await supabase.table("fcm_tokens").select(FCM_TOKEN_COLUMNS).eq("user_id", user_id).eq("is_active", True).execute()
+        tokens = result.data or []
+
         logger.info(f"Retrieved {len(tokens)} active FCM tokens for user {user_id}")
-        return tokens
+        # Rows already match FCMTokenResponse; serialize them once without re-validation
+        return json_response(tokens)
         
     except Exception as e:
         logger.error(f"Failed to retrieve FCM tokens for user {user_id}: {str(e)}")
@@ -271,7 +265,7 @@ async def cleanup_fcm_tokens(user_id: str = Depends(verify_token)):
     """
     try:
         # First, get count of inactive tokens for this user
-        inactive_tokens = supabase.table("fcm_tokens").select("id").eq("user_id", user_id).eq("is_active", False).execute()
+        inactive_tokens = await supabase.table("fcm_tokens").select("id").eq("user_id", user_id).eq("is_active", False).execute()
         
         if not inactive_tokens.data:
             return FCMCleanupResponse(
@@ -280,7 +274,7 @@ async def cleanup_fcm_tokens(user_id: str = Depends(verify_token)):
             )
         
         # Delete inactive tokens for this user
-        delete_result = supabase.table("fcm_tokens").delete().eq("user_id", user_id).eq("is_active", False).execute()
+        delete_result = await supabase.table("fcm_tokens").delete().eq("user_id", user_id).eq("is_active", False).execute()
         
         removed_count = len(delete_result.data) if delete_result.data else 0
         
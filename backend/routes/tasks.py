@@ -1,11 +1,22 @@
+import asyncio
+import hashlib
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from uuid import UUID
-from datetime import time, date
-from typing import Optional
+from datetime import time, date, datetime, timedelta, timezone
+from typing import Optional, Literal, Union
 from utils.supabase_client import supabase
 from utils.auth_utils import verify_token
+from utils.idempotency import IdempotencyGuard
+from utils.responses import dumps, json_response
+from utils.task_cache import get_cached_tasks, cache_tasks, cache_upsert_tasks, cache_remove_tasks
+from utils.reminder_index import reminder_index
+from utils.task_versions import get_task_version, bump_task_version, make_etag, etag_matches
+from utils.cursors import (
+    encode_sync_cursor, decode_sync_cursor, encode_page_cursor, decode_page_cursor, parse_timestamp
+)
 
 # Set up module-level logger
 logger = logging.getLogger(__name__)
@@ -34,88 +45,636 @@ class TaskUpdate(BaseModel):
     is_late: Optional[bool] = None
     user_id: Optional[str] = None
 
+# Response models (documentation only: GET /tasks returns pre-serialized responses)
+class TaskOut(BaseModel):
+    id: str
+    user_id: Optional[str] = None
+    name: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    category: Optional[str] = None
+    priority: Optional[str] = None
+    completed: Optional[bool] = None
+    is_late: Optional[bool] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+class TaskPage(BaseModel):
+    tasks: list[TaskOut]
+    next_cursor: Optional[str] = None
+
+class TaskDelta(BaseModel):
+    tasks: list[TaskOut]
+    deleted: list[str]
+    cursor: str
+    reset: bool
+
+class TaskBatchOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    local_id: Optional[str] = None  # Client-side (IndexedDB) id, echoed back in results
+    id: Optional[str] = None  # Server id for update/delete (may be a local_id created in the same batch)
+    task: Optional[dict] = None  # TaskCreate fields for create, TaskUpdate fields for update
+
+class TaskBatchRequest(BaseModel):
+    operations: list[TaskBatchOperation]
+
+# Upper bound on operations per batch request (keeps PostgREST payloads reasonable)
+MAX_BATCH_OPERATIONS = 500
+# Per-task updates of one batch run this many at a time
+BATCH_UPDATE_CONCURRENCY = 10
+
+def build_task_payload(task: TaskCreate, user_id: str) -> dict:
+    """Build the tasks table row for a new task."""
+    return {
+        "user_id": user_id,
+        "name": task.name,
+        "start_time": task.start_time.isoformat(),
+        "end_time": task.end_time.isoformat(),
+        "category": task.category,
+        "priority": task.priority,
+        "completed": task.completed,
+        "is_late": task.is_late,
+        "created_at": task.created_at.isoformat()
+    }
+
+def build_update_payload(task: TaskUpdate) -> dict:
+    """Build the column changes for a task update, skipping unset fields."""
+    update_data = {k: v for k, v in task.dict().items() if v is not None and k != "user_id"}
+    if "start_time" in update_data:
+        update_data["start_time"] = update_data["start_time"].isoformat()
+    if "end_time" in update_data:
+        update_data["end_time"] = update_data["end_time"].isoformat()
+    return update_data
+
+# Tombstones are kept this long; older delta cursors get a full resync instead
+TOMBSTONE_RETENTION_DAYS = 30
+
+# Delta reads start this far before the cursor: updated_at is the writing
+# transaction's start time, so a write can commit after a delta read with a
+# timestamp below the watermark that read returned. Rows in the overlap are
+# re-delivered; clients merge by id, so that is harmless.
+SYNC_OVERLAP_SECONDS = 5
+
+# Page sizes for keyset pagination / NDJSON streaming of GET /tasks
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 1000
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Columns clients may request with ?fields= (id is always included)
+TASK_FIELDS = {
+    "id", "user_id", "name", "start_time", "end_time", "category", "priority",
+    "completed", "is_late", "created_at", "updated_at"
+}
+
+def parse_task_fields(fields: Optional[str]) -> Optional[list[str]]:
+    """Validate a comma-separated ?fields= list. Raises ValueError for unknown columns."""
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - TASK_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [field for field in dict.fromkeys(requested) if field != "id"]
+
+def build_task_filters(
+    created_from: Optional[date] = None,
+    created_to: Optional[date] = None,
+    completed: Optional[bool] = None,
+    category: Optional[str] = None,
+    priority: Optional[str] = None
+) -> list[tuple[str, str, object]]:
+    """Collect list filters as (column, operator, value) for PostgREST or in-memory use."""
+    filters = []
+    if created_from is not None:
+        filters.append(("created_at", "gte", created_from.isoformat()))
+    if created_to is not None:
+        filters.append(("created_at", "lte", created_to.isoformat()))
+    if completed is not None:
+        filters.append(("completed", "eq", completed))
+    if category is not None:
+        filters.append(("category", "eq", category))
+    if priority is not None:
+        filters.append(("priority", "eq", priority))
+    return filters
+
+def apply_task_filters(query, filters: list[tuple[str, str, object]]):
+    """Push filters down into a PostgREST query."""
+    for column, operator, value in filters:
+        query = getattr(query, operator)(column, value)
+    return query
+
+def task_matches(task: dict, filters: list[tuple[str, str, object]]) -> bool:
+    """Evaluate the same filters against a cached task row."""
+    for column, operator, value in filters:
+        current = task.get(column)
+        if operator == "eq" and current != value:
+            return False
+        # created_at is an ISO date, so string order is date order
+        if operator == "gte" and (current is None or str(current)[:10] < value):
+            return False
+        if operator == "lte" and (current is None or str(current)[:10] > value):
+            return False
+    return True
+
+def project_task(task: dict, columns: Optional[list[str]]) -> dict:
+    return task if columns is None else {column: task.get(column) for column in columns}
+
+def _is_uuid(value: Optional[str]) -> bool:
+    try:
+        UUID(str(value))
+        return True
+    except (TypeError, ValueError):
+        return False
+
 @router.post("/", response_model=dict)
-async def create_task(task: TaskCreate, user_id: str = Depends(verify_token)):
+async def create_task(
+    task: TaskCreate,
+    response: Response,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
         if task.user_id != user_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User ID mismatch")
 
-        payload = {
-            "user_id": user_id,
-            "name": task.name,
-            "start_time": task.start_time.isoformat(),
-            "end_time": task.end_time.isoformat(),
-            "category": task.category,
-            "priority": task.priority,
-            "completed": task.completed,
-            "is_late": task.is_late,
-            "created_at": task.created_at.isoformat()
-        }
+        async with IdempotencyGuard(user_id, "POST /tasks", idempotency_key, task.dict()) as guard:
+            if guard.replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+                return guard.response
+
+            payload = build_task_payload(task, user_id)
+
+            logger.info(f"Inserting task for user {user_id}: {payload}")
 
-        logger.info(f"Inserting task for user {user_id}: {payload}")
+            data = await supabase.table("tasks").insert(payload).execute()
+            if not data.data or not data.data[0].get("id"):
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create task: No ID returned")
 
-        data = supabase.table("tasks").insert(payload).execute()
-        if not data.data or not data.data[0].get("id"):
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create task: No ID returned")
-        
-        response = data.data[0]
-        response["id"] = str(response["id"])  # Ensure ID is string
-        logger.info(f"Created task: {response}")
-        return response
+            created = data.data[0]
+            created["id"] = str(created["id"])  # Ensure ID is string
+            logger.info(f"Created task: {created}")
+            await bump_task_version(user_id)
+            await cache_upsert_tasks(user_id, [created])
+            reminder_index.upsert(created)
+            guard.save(created)
+            return created
     except Exception as e:
         logger.error(f"Task insert failed for user {user_id}: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-@router.get("/", response_model=list[dict])
-async def get_tasks(user_id: str = Depends(verify_token)):
+async def fetch_task_page(
+    user_id: str,
+    limit: int,
+    after_id: Optional[str] = None,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list[tuple[str, str, object]]] = None
+) -> list[dict]:
+    """
+    Fetch one page of the user's tasks with a keyset query ordered by id.
+
+    Uses `id > after_id` instead of OFFSET, so every page costs the same
+    regardless of how deep into the user's history it is.
+    """
+    query = supabase.table("tasks").select(",".join(columns) if columns else "*").eq("user_id", user_id)
+    query = apply_task_filters(query, filters or [])
+    if after_id:
+        query = query.gt("id", after_id)
+    data = await query.order("id").limit(limit).execute()
+    return data.data or []
+
+async def iter_task_ndjson(
+    user_id: str,
+    page_size: int,
+    after_id: Optional[str] = None,
+    columns: Optional[list[str]] = None,
+    filters: Optional[list[tuple[str, str, object]]] = None
+):
+    """Yield the user's tasks as NDJSON lines, fetching one page at a time."""
+    sent = 0
+    try:
+        while True:
+            page = await fetch_task_page(user_id, page_size, after_id, columns, filters)
+            if not page:
+                break
+            yield b"".join(dumps(task) + b"\n" for task in page)
+            sent += len(page)
+            if len(page) < page_size:
+                break
+            after_id = str(page[-1]["id"])
+    except Exception as e:
+        # Headers are already sent; end the stream and let the client retry
+        logger.error(f"Task stream failed for user {user_id} after {sent} rows: {str(e)}")
+        return
+    logger.info(f"Streamed {sent} tasks for user {user_id}")
+
+async def fetch_task_delta(user_id: str, since: str) -> dict:
+    """
+    Fetch tasks changed since a sync cursor, plus tombstones and a new cursor.
+    Raises ValueError for a malformed cursor.
+    """
+    watermark, boundary_ids = decode_sync_cursor(since) if since else (None, set())
+    retention_cutoff = datetime.now(timezone.utc) - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    reset = watermark is None or watermark < retention_cutoff
+
+    query = supabase.table("tasks").select("*").eq("user_id", user_id)
+    if not reset:
+        # Overlap window (see SYNC_OVERLAP_SECONDS) so late commits are not
+        # missed; rows the client already has at the boundary are dropped below.
+        since_at = (watermark - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()
+        query = query.gte("updated_at", since_at)
+    data = await query.execute()
+
+    tombstone_rows = []
+    if not reset:
+        tombstones = await supabase.table("task_tombstones").select("task_id, deleted_at").eq(
+            "user_id", user_id
+        ).gte("deleted_at", since_at).execute()
+        tombstone_rows = tombstones.data or []
+
+    # Collect (timestamp, id) for every change, skipping already-delivered boundary rows
+    tasks, deleted, changes = [], [], []
+    for task in data.data or []:
+        changed_at = parse_timestamp(task["updated_at"]) if task.get("updated_at") else None
+        if not reset and changed_at == watermark and task["id"] in boundary_ids:
+            continue
+        tasks.append(task)
+        if changed_at:
+            changes.append((changed_at, task["id"]))
+    for tombstone in tombstone_rows:
+        task_id = str(tombstone["task_id"])
+        deleted_at = parse_timestamp(tombstone["deleted_at"])
+        if deleted_at == watermark and task_id in boundary_ids:
+            continue
+        deleted.append(task_id)
+        changes.append((deleted_at, task_id))
+
+    # Never move the cursor back: overlap rows can all be older than it
+    latest = max((changed_at for changed_at, _ in changes), default=None)
+    if latest is not None and (watermark is None or latest >= watermark):
+        new_watermark = latest
+        new_boundary = {task_id for changed_at, task_id in changes if changed_at == new_watermark}
+        if new_watermark == watermark:
+            new_boundary |= boundary_ids
+    else:
+        new_watermark = watermark or datetime.fromtimestamp(0, timezone.utc)
+        new_boundary = boundary_ids
+
+    logger.info(
+        f"Delta sync for user {user_id}: {len(tasks)} changed, {len(deleted)} deleted, reset={reset}"
+    )
+    return {
+        "tasks": tasks,
+        "deleted": deleted,
+        "cursor": encode_sync_cursor(new_watermark, sorted(new_boundary)),
+        "reset": reset
+    }
+
+@router.get("/", response_model=Union[list[TaskOut], TaskPage, TaskDelta])
+async def get_tasks(
+    request: Request,
+    since: Optional[str] = Query(None, description="Sync cursor from a previous response; empty string for an initial snapshot"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size for keyset pagination"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return, e.g. id,name,start_time,completed"),
+    created_from: Optional[date] = Query(None, description="Only tasks with created_at on or after this date"),
+    created_to: Optional[date] = Query(None, description="Only tasks with created_at on or before this date"),
+    completed: Optional[bool] = Query(None),
+    category: Optional[str] = Query(None),
+    priority: Optional[str] = Query(None),
+    user_id: str = Depends(verify_token)
+):
+    """
+    List the user's tasks.
+
+    - No parameters: the full task list (legacy behaviour).
+    - `since`: delta mode. Returns only tasks changed at or after the cursor's
+      watermark, tombstones for deleted tasks, and a new cursor:
+      {"tasks": [...], "deleted": [task_id, ...], "cursor": "...", "reset": bool}.
+      An empty `since` (or a cursor older than the tombstone retention window)
+      returns a full snapshot with `reset` set, so the client replaces its cache.
+    - `limit` / `cursor`: one keyset page, {"tasks": [...], "next_cursor": str | null}.
+    - `Accept: application/x-ndjson`: one task per line, streamed page by page,
+      so memory per request is bounded by the page size (`limit`, default 500).
+
+    Outside delta mode, `fields` (whitelisted columns) and the created_at /
+    completed / category / priority filters are pushed down into the
+    PostgREST query, or applied to the cached list when it is warm.
+
+    Every mode carries a strong ETag built from the user's task list version
+    (bumped by the write routes) and the query. A matching If-None-Match gets
+    a 304 without touching Supabase.
+
+    Rows are returned exactly as PostgREST sends them (ids are already JSON
+    strings) and serialized once by json_response, skipping response_model
+    re-validation; the models above only document the shapes.
+    """
     try:
+        ndjson = NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+        variant = hashlib.sha1(f"{request.url.query}|{ndjson}".encode()).hexdigest()[:8]
+        version = await get_task_version(user_id)
+        etag = make_etag(version, variant)
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            logger.info(f"Task list for user {user_id} not modified")
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers)
+
+        columns = parse_task_fields(fields)
+        filters = build_task_filters(created_from, created_to, completed, category, priority)
+
+        if since is not None:
+            if limit is not None or cursor is not None:
+                raise ValueError("since cannot be combined with limit/cursor")
+            if columns or filters:
+                raise ValueError("since cannot be combined with fields or filters")
+            return json_response(await fetch_task_delta(user_id, since), headers=cache_headers)
+
+        after_id = decode_page_cursor(cursor) if cursor else None
+
+        if ndjson:
+            logger.info(f"Streaming tasks for user {user_id}")
+            return StreamingResponse(
+                iter_task_ndjson(user_id, limit or DEFAULT_PAGE_SIZE, after_id, columns, filters),
+                media_type=NDJSON_MEDIA_TYPE,
+                headers=cache_headers
+            )
+
+        if limit is not None or after_id is not None:
+            page_size = limit or DEFAULT_PAGE_SIZE
+            tasks = await fetch_task_page(user_id, page_size, after_id, columns, filters)
+            next_cursor = encode_page_cursor(str(tasks[-1]["id"])) if len(tasks) == page_size else None
+            logger.info(f"Fetched page of {len(tasks)} tasks for user {user_id}")
+            return json_response({"tasks": tasks, "next_cursor": next_cursor}, headers=cache_headers)
+
+        cached = await get_cached_tasks(user_id)
+        if cached is not None:
+            if columns or filters:
+                cached = [project_task(task, columns) for task in cached if task_matches(task, filters)]
+            logger.info(f"Serving {len(cached)} cached tasks for user {user_id}")
+            return json_response(cached, headers=cache_headers)
+
+        if columns or filters:
+            # Narrow results are not cached; only the full list feeds the task cache
+            query = supabase.table("tasks").select(",".join(columns) if columns else "*").eq("user_id", user_id)
+            data = await apply_task_filters(query, filters).execute()
+            logger.info(f"Fetched {len(data.data)} filtered tasks for user {user_id}")
+            return json_response(data.data, headers=cache_headers)
+
         logger.info(f"Fetching tasks for user {user_id}")
-        data = supabase.table("tasks").select("*").eq("user_id", user_id).execute()
-        tasks = [
-            {**task, "id": str(task["id"])}  # Convert UUID to string
-            for task in data.data
-        ]
+        data = await supabase.table("tasks").select("*").eq("user_id", user_id).execute()
+        tasks = data.data or []
         logger.info(f"Fetched {len(tasks)} tasks for user {user_id}")
-        return tasks
+        # Skip the fill if a write landed while we were reading, so it can't be overwritten
+        if await get_task_version(user_id) == version:
+            await cache_tasks(user_id, tasks)
+        return json_response(tasks, headers=cache_headers)
+    except ValueError as e:
+        logger.warning(f"Bad task list request from user {user_id}: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         logger.error(f"Task fetch failed for user {user_id}: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.put("/{task_id}", response_model=dict)
-async def update_task(task_id: UUID, task: TaskUpdate, user_id: str = Depends(verify_token)):
+async def update_task(
+    task_id: UUID,
+    task: TaskUpdate,
+    response: Response,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
         if task.user_id and task.user_id != user_id:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User ID mismatch")
 
-        update_data = {k: v for k, v in task.dict().items() if v is not None and k != "user_id"}
-        if "start_time" in update_data:
-            update_data["start_time"] = update_data["start_time"].isoformat()
-        if "end_time" in update_data:
-            update_data["end_time"] = update_data["end_time"].isoformat()
-
-        logger.info(f"Updating task {task_id} for user {user_id} with {update_data}")
-
-        data = supabase.table("tasks").update(update_data).eq("id", str(task_id)).eq("user_id", user_id).execute()
-        if not data.data:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-        
-        response = data.data[0]
-        response["id"] = str(response["id"])
-        logger.info(f"Updated task: {response}")
-        return response
+        update_data = build_update_payload(task)
+
+        async with IdempotencyGuard(user_id, f"PUT /tasks/{task_id}", idempotency_key, update_data) as guard:
+            if guard.replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+                return guard.response
+
+            logger.info(f"Updating task {task_id} for user {user_id} with {update_data}")
+
+            data = await supabase.table("tasks").update(update_data).eq("id", str(task_id)).eq("user_id", user_id).execute()
+            if not data.data:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+
+            updated = data.data[0]
+            updated["id"] = str(updated["id"])
+            logger.info(f"Updated task: {updated}")
+            await bump_task_version(user_id)
+            await cache_upsert_tasks(user_id, [updated])
+            reminder_index.upsert(updated)
+            guard.save(updated)
+            return updated
     except Exception as e:
         logger.error(f"Task update failed for user {user_id}: {str(e)}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 @router.delete("/{task_id}", response_model=dict)
-async def delete_task(task_id: UUID, user_id: str = Depends(verify_token)):
+async def delete_task(
+    task_id: UUID,
+    response: Response,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None)
+):
     try:
-        logger.info(f"Deleting task {task_id} for user {user_id}")
-        data = supabase.table("tasks").delete().eq("id", str(task_id)).eq("user_id", user_id).execute()
-        if not data.data:
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
-        logger.info(f"Deleted task {task_id} for user {user_id}")
-        return {"message": "Task deleted"}
+        async with IdempotencyGuard(user_id, f"DELETE /tasks/{task_id}", idempotency_key) as guard:
+            if guard.replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+                return guard.response
+
+            logger.info(f"Deleting task {task_id} for user {user_id}")
+            data = await supabase.table("tasks").delete().eq("id", str(task_id)).eq("user_id", user_id).execute()
+            if not data.data:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+            logger.info(f"Deleted task {task_id} for user {user_id}")
+            await bump_task_version(user_id)
+            await cache_remove_tasks(user_id, [str(task_id)])
+            reminder_index.remove(str(task_id))
+            result = {"message": "Task deleted"}
+            guard.save(result)
+            return result
     except Exception as e:
         logger.error(f"Task delete failed for user {user_id}: {str(e)}")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/batch", response_model=dict)
+async def batch_tasks(
+    batch: TaskBatchRequest,
+    response: Response,
+    user_id: str = Depends(verify_token),
+    idempotency_key: Optional[str] = Header(None)
+):
+    """
+    Apply a mixed list of create/update/delete operations in a few bulk queries.
+
+    Operations are applied in the same phase order as sync.js: creates, then
+    updates, then deletes. Creates and deletes are one PostgREST call each;
+    updates are one update per task scoped to the owner (so a task deleted
+    meanwhile comes back not_found instead of being re-inserted), run
+    BATCH_UPDATE_CONCURRENCY at a time. A reconnect with dozens of queued
+    edits costs a few round trips.
+
+    Returns:
+        dict: {"results": [...], "id_map": {local_id: server_id}} where each
+        result carries the operation index, op, local_id, id and a status of
+        created / updated / deleted / not_found / error.
+    """
+    operations = batch.operations
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many operations: {len(operations)} (max {MAX_BATCH_OPERATIONS})"
+        )
+
+    try:
+        async with IdempotencyGuard(user_id, "POST /tasks/batch", idempotency_key, batch.dict()) as guard:
+            if guard.replayed:
+                response.headers["Idempotent-Replayed"] = "true"
+                return guard.response
+
+            result = await apply_task_batch(operations, user_id)
+            await bump_task_version(user_id)
+            written = [item["task"] for item in result["results"] if item["status"] in ("created", "updated")]
+            deleted = [item["id"] for item in result["results"] if item["status"] == "deleted"]
+            await cache_upsert_tasks(user_id, written)
+            await cache_remove_tasks(user_id, deleted)
+            reminder_index.upsert_many(written)
+            reminder_index.remove_many(deleted)
+            # A retry of a batch with failed items must run again, not replay the failure
+            if not any(item["status"] == "error" for item in result["results"]):
+                guard.save(result)
+            return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Task batch failed for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+async def apply_task_batch(operations: list[TaskBatchOperation], user_id: str) -> dict:
+    """Run the create/update/delete phases of a batch; see batch_tasks."""
+    results: list[Optional[dict]] = [None] * len(operations)
+    id_map: dict[str, str] = {}
+
+    def set_result(index: int, op: TaskBatchOperation, result_status: str, task_id: Optional[str] = None, **extra):
+        results[index] = {
+            "index": index,
+            "op": op.op,
+            "local_id": op.local_id,
+            "id": task_id,
+            "status": result_status,
+            **extra
+        }
+
+    # ---------- Creates (single bulk insert) ----------
+    creates = []
+    for index, op in enumerate(operations):
+        if op.op != "create":
+            continue
+        try:
+            task = TaskCreate(**(op.task or {}))
+        except Exception as e:
+            set_result(index, op, "error", detail=str(e))
+            continue
+        if task.user_id != user_id:
+            set_result(index, op, "error", detail="User ID mismatch")
+            continue
+        creates.append((index, op, build_task_payload(task, user_id)))
+
+    if creates:
+        try:
+            data = await supabase.table("tasks").insert([payload for _, _, payload in creates]).execute()
+            rows = data.data or []
+            if len(rows) != len(creates):
+                raise ValueError(f"Expected {len(creates)} inserted rows, got {len(rows)}")
+            for (index, op, _), row in zip(creates, rows):
+                row["id"] = str(row["id"])
+                if op.local_id:
+                    id_map[op.local_id] = row["id"]
+                set_result(index, op, "created", row["id"], task=row)
+        except Exception as e:
+            logger.error(f"Batch insert failed for user {user_id}: {str(e)}")
+            for index, op, _ in creates:
+                set_result(index, op, "error", detail=str(e))
+
+    # ---------- Updates (one owner-scoped update per task, run concurrently) ----------
+    updates = []
+    for index, op in enumerate(operations):
+        if op.op != "update":
+            continue
+        task_id = id_map.get(op.id or "", op.id) or id_map.get(op.local_id or "")
+        if not _is_uuid(task_id):
+            set_result(index, op, "not_found", task_id)
+            continue
+        try:
+            task = TaskUpdate(**(op.task or {}))
+        except Exception as e:
+            set_result(index, op, "error", task_id, detail=str(e))
+            continue
+        if task.user_id and task.user_id != user_id:
+            set_result(index, op, "error", task_id, detail="User ID mismatch")
+            continue
+        updates.append((index, op, str(UUID(task_id)), build_update_payload(task)))
+
+    if updates:
+        # Later operations on the same task win, as they would sequentially
+        changes_by_task: dict[str, dict] = {}
+        for _, _, task_id, changes in updates:
+            changes_by_task.setdefault(task_id, {}).update(changes)
+
+        semaphore = asyncio.Semaphore(BATCH_UPDATE_CONCURRENCY)
+
+        async def update_one(task_id: str, changes: dict) -> Optional[dict]:
+            async with semaphore:
+                data = await supabase.table("tasks").update(changes).eq("id", task_id).eq("user_id", user_id).execute()
+            return data.data[0] if data.data else None
+
+        outcomes = await asyncio.gather(
+            *(update_one(task_id, changes) for task_id, changes in changes_by_task.items()),
+            return_exceptions=True
+        )
+        written = dict(zip(changes_by_task, outcomes))
+        for task_id, outcome in written.items():
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch update of task {task_id} failed for user {user_id}: {str(outcome)}")
+
+        for index, op, task_id, _ in updates:
+            row = written[task_id]
+            if isinstance(row, Exception):
+                set_result(index, op, "error", task_id, detail=str(row))
+            elif row is None:
+                # Not this user's task, or deleted since the client queued the edit
+                set_result(index, op, "not_found", task_id)
+            else:
+                row["id"] = task_id
+                set_result(index, op, "updated", task_id, task=row)
+
+    # ---------- Deletes (single bulk delete) ----------
+    deletes = []
+    for index, op in enumerate(operations):
+        if op.op != "delete":
+            continue
+        task_id = id_map.get(op.id or "", op.id) or id_map.get(op.local_id or "")
+        if not _is_uuid(task_id):
+            set_result(index, op, "not_found", task_id)
+            continue
+        deletes.append((index, op, str(UUID(task_id))))
+
+    if deletes:
+        try:
+            ids = list({task_id for _, _, task_id in deletes})
+            data = await supabase.table("tasks").delete().eq("user_id", user_id).in_("id", ids).execute()
+            deleted_ids = {str(row["id"]) for row in data.data or []}
+            for index, op, task_id in deletes:
+                set_result(index, op, "deleted" if task_id in deleted_ids else "not_found", task_id)
+        except Exception as e:
+            logger.error(f"Batch delete failed for user {user_id}: {str(e)}")
+            for index, op, task_id in deletes:
+                set_result(index, op, "error", task_id, detail=str(e))
+
+    logger.info(
+        f"Batch for user {user_id}: {len(creates)} creates, {len(updates)} updates, {len(deletes)} deletes"
+    )
+    return {"results": results, "id_map": id_map}
@@ -1,8 +1,12 @@
+import hashlib
 import logging
 import os
+import time
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from utils.cache import TTLCache
+from utils.jwks import ASYMMETRIC_ALGORITHMS, jwks_cache
 
 # Load Supabase JWT secret
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
@@ -13,30 +17,86 @@ security = HTTPBearer()
 # Set up module-level logger
 logger = logging.getLogger(__name__)
 
+# Verified tokens are cached (keyed by a hash of the token) until their own exp
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_MAX_TTL_SECONDS = int(os.getenv("AUTH_CACHE_MAX_TTL_SECONDS", "3600"))
+
+_verified_tokens = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_MAX_TTL_SECONDS, name="verified_tokens")
+
+
+def _token_key(token: str) -> bytes:
+    """Cache key for a token; the raw bearer token is never held as a key."""
+    return hashlib.sha256(token.encode()).digest()
+
+
+async def _signing_key(token: str):
+    """
+    Pick the verification key and algorithm from the token header.
+
+    HS256 tokens use SUPABASE_JWT_SECRET; RS256/ES256 tokens use the cached
+    JWKS key for their kid. Only an unknown kid (key rotation) waits on a
+    JWKS refetch.
+    """
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm == "HS256" and SUPABASE_JWT_SECRET:
+        return SUPABASE_JWT_SECRET, algorithm
+    if algorithm in ASYMMETRIC_ALGORITHMS:
+        key = await jwks_cache.fetch_kid(header.get("kid"))
+        if key is None:
+            raise jwt.InvalidTokenError(f"unknown signing key {header.get('kid')}")
+        if key.algorithm_name != algorithm:
+            raise jwt.InvalidTokenError(f"key {header.get('kid')} does not sign {algorithm}")
+        return key, algorithm
+    raise jwt.InvalidTokenError(f"unsupported algorithm {algorithm}")
+
+
+def get_auth_cache_stats():
+    """Hit/miss counters of the verified-token cache."""
+    return _verified_tokens.stats()
+
+
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     Verify the JWT token from the Authorization header.
-    Logs decoded payload and any errors to app.log.
+
+    A token that already verified is served from the cache until its exp, so
+    repeat requests with the same token skip signature verification.
+    Errors are logged to app.log.
     """
+    token = credentials.credentials
+    cache_key = _token_key(token)
+    user_id = _verified_tokens.get(cache_key)
+    if user_id is not None:
+        return user_id
+
     try:
-        token = credentials.credentials
+        key, algorithm = await _signing_key(token)
         decoded = jwt.decode(
             token,
-            SUPABASE_JWT_SECRET,
-            algorithms=["HS256"],
+            key,
+            algorithms=[algorithm],
             audience="authenticated"
         )
 
-        # Log decoded payload instead of printing
-        logger.info(f"JWT verified for user_id={decoded.get('sub')}, payload={decoded}")
-
-        if decoded.get("sub") is None:
+        user_id = decoded.get("sub")
+        if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token: no user_id"
             )
 
-        return decoded["sub"]  # Return user_id for route use
+        # Cache until the token expires (capped); an expired token is re-decoded
+        # so the client still gets the "Token expired" error
+        exp = decoded.get("exp")
+        ttl = AUTH_CACHE_MAX_TTL_SECONDS if exp is None else min(exp - time.time(), AUTH_CACHE_MAX_TTL_SECONDS)
+        if ttl > 0:
+            _verified_tokens.set(cache_key, user_id, ttl=ttl)
+
+        # Lazy formatting: this runs on every cache miss
+        logger.debug("JWT verified for user_id=%s", user_id)
+
+        return user_id  # Return user_id for route use
 
     except jwt.ExpiredSignatureError:
         logger.warning("JWT verification failed: token expired")
@@ -46,7 +106,7 @@ async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(secur
         )
 
     except jwt.InvalidTokenError as e:
-        logger.error(f"JWT verification failed: {str(e)}")
+        logger.error("JWT verification failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token"
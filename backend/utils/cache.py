@@ -0,0 +1,128 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Optional shared store (Redis) for multi-process / multi-instance deployments
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis_asyncio = None
+    REDIS_AVAILABLE = False
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+_redis_checked = False
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Size-bounded in-process cache with LRU eviction and per-entry TTL.
+
+    Entries expire after `ttl` seconds (or a per-entry ttl passed to set()),
+    and the least recently used entry is evicted once `maxsize` is reached.
+    Hit/miss/eviction counters are kept for tuning via stats().
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (refreshing its LRU position) or default."""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live value without touching LRU order or hit/miss counters."""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting least recently used entries past maxsize."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove an entry, returning its value (even if expired) or default."""
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key, _MISSING)
+        return entry is not _MISSING and entry[0] > time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning maxsize/ttl."""
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def get_shared_store():
+    """
+    Get the shared Redis client if REDIS_URL is set and redis is installed.
+
+    Returns:
+        redis.asyncio.Redis or None when running with in-process caches only
+    """
+    global _redis_client, _redis_checked
+
+    if _redis_checked:
+        return _redis_client
+    _redis_checked = True
+
+    redis_url = os.getenv("REDIS_URL")
+    if not redis_url:
+        return None
+
+    if not REDIS_AVAILABLE:
+        logger.warning("REDIS_URL is set but the redis package is not installed; using in-process caches only")
+        return None
+
+    _redis_client = redis_asyncio.from_url(redis_url, decode_responses=True)
+    logger.info("Shared Redis store configured")
+    return _redis_client
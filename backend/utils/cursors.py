@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime, timezone
+from uuid import UUID
+
+
+def encode_cursor(fields: dict) -> str:
+    """Encode cursor fields as an opaque, URL-safe string."""
+    raw = json.dumps({"v": 1, **fields}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        fields = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {str(e)}")
+    if not isinstance(fields, dict) or fields.get("v") != 1:
+        raise ValueError("Invalid cursor: unsupported version")
+    return fields
+
+
+def encode_sync_cursor(watermark: datetime, boundary_ids: list[str]) -> str:
+    """
+    Encode an updated_at watermark as a delta sync cursor.
+
+    boundary_ids are the task ids already delivered at exactly the watermark,
+    so the next delta can compare inclusively without re-sending them.
+    """
+    return encode_cursor({"ts": watermark.isoformat(), "ids": boundary_ids})
+
+
+def decode_sync_cursor(cursor: str) -> tuple[datetime, set[str]]:
+    """Decode a sync cursor to (watermark, boundary_ids). Raises ValueError if malformed."""
+    fields = decode_cursor(cursor)
+    try:
+        watermark = datetime.fromisoformat(fields["ts"])
+        boundary_ids = {str(task_id) for task_id in fields.get("ids", [])}
+    except Exception as e:
+        raise ValueError(f"Invalid sync cursor: {str(e)}")
+    if watermark.tzinfo is None:
+        watermark = watermark.replace(tzinfo=timezone.utc)
+    return watermark, boundary_ids
+
+
+def encode_page_cursor(last_id: str) -> str:
+    """Encode the keyset position (last task id of a page) as a page cursor."""
+    return encode_cursor({"after": last_id})
+
+
+def decode_page_cursor(cursor: str) -> str:
+    """Decode a page cursor to the task id to continue after. Raises ValueError if malformed."""
+    fields = decode_cursor(cursor)
+    try:
+        return str(UUID(fields["after"]))
+    except Exception as e:
+        raise ValueError(f"Invalid page cursor: {str(e)}")
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse a PostgREST timestamp, assuming UTC when no offset is given."""
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
@@ -0,0 +1,109 @@
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from utils.cache import TTLCache
+from utils.supabase_client import supabase
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Display names used in reminder text, cached per user
+DISPLAY_NAME_CACHE_SIZE = int(os.getenv("DISPLAY_NAME_CACHE_SIZE", "10000"))
+DISPLAY_NAME_TTL_SECONDS = int(os.getenv("DISPLAY_NAME_TTL_SECONDS", "3600"))
+# Users without a profile name are re-checked sooner
+DISPLAY_NAME_NEGATIVE_TTL_SECONDS = int(os.getenv("DISPLAY_NAME_NEGATIVE_TTL_SECONDS", "600"))
+DISPLAY_NAME_LOOKUP_CHUNK = int(os.getenv("DISPLAY_NAME_LOOKUP_CHUNK", "200"))
+# How often profile edits are checked for (invalidates changed names)
+DISPLAY_NAME_REFRESH_SECONDS = int(os.getenv("DISPLAY_NAME_REFRESH_SECONDS", "300"))
+
+# Name used when a user has no profile name
+DEFAULT_DISPLAY_NAME = "you"
+
+_PROFILE_COLUMNS = "id, full_name, display_name"
+
+_MISSING = object()
+_names = TTLCache(maxsize=DISPLAY_NAME_CACHE_SIZE, ttl=DISPLAY_NAME_TTL_SECONDS, name="display_names")
+# Profile changes after this point invalidate cached names (nothing is cached before it)
+_changes_since = datetime.now(timezone.utc)
+
+
+def _profile_name(profile: dict) -> Optional[str]:
+    name = profile.get("display_name") or profile.get("full_name")
+    return name.strip() if name and name.strip() else None
+
+
+def _cache_name(user_id: str, name: Optional[str]):
+    # None is cached too (negative result), for a shorter time
+    _names.set(user_id, name, ttl=None if name else DISPLAY_NAME_NEGATIVE_TTL_SECONDS)
+
+
+async def get_display_names(user_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    Display names for many users, with one chunked in_() query for cache misses.
+
+    Args:
+        user_ids: Users to resolve (duplicates are fine)
+
+    Returns:
+        Dict of user_id -> name, "you" when the user has no profile name
+    """
+    names: Dict[str, str] = {}
+    misses: List[str] = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = _names.get(user_id, _MISSING)
+        if cached is _MISSING:
+            misses.append(user_id)
+        else:
+            names[user_id] = cached or DEFAULT_DISPLAY_NAME
+
+    for i in range(0, len(misses), DISPLAY_NAME_LOOKUP_CHUNK):
+        chunk = misses[i:i + DISPLAY_NAME_LOOKUP_CHUNK]
+        try:
+            response = await supabase.table("profiles").select(_PROFILE_COLUMNS).in_("id", chunk).execute()
+        except Exception as e:
+            # Not cached, so the next run retries
+            logger.warning(f"Could not fetch display names for {len(chunk)} users: {str(e)}")
+            names.update((user_id, DEFAULT_DISPLAY_NAME) for user_id in chunk)
+            continue
+
+        found = {str(profile["id"]): _profile_name(profile) for profile in response.data or []}
+        for user_id in chunk:
+            name = found.get(user_id)
+            _cache_name(user_id, name)
+            names[user_id] = name or DEFAULT_DISPLAY_NAME
+
+    return names
+
+
+async def refresh_changed_display_names():
+    """
+    Invalidate cached names whose profile changed since the last call.
+
+    Profiles are edited directly from the frontend (which sets updated_at),
+    so this runs on a schedule: one query returning only changed rows.
+    """
+    global _changes_since
+
+    started_at = datetime.now(timezone.utc)
+    since = (_changes_since - timedelta(seconds=5)).isoformat()
+    try:
+        response = await supabase.table("profiles").select(_PROFILE_COLUMNS).gte("updated_at", since).execute()
+    except Exception as e:
+        logger.warning(f"Could not check for changed profiles: {str(e)}")
+        return
+
+    changed = 0
+    for profile in response.data or []:
+        user_id = str(profile["id"])
+        if user_id in _names:
+            _cache_name(user_id, _profile_name(profile))
+            changed += 1
+    _changes_since = started_at
+    if changed:
+        logger.info(f"Refreshed {changed} cached display names after profile changes")
+
+
+def get_display_name_stats() -> dict:
+    """Hit/miss counters of the display-name cache."""
+    return _names.stats()
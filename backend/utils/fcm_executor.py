@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Threads reserved for blocking firebase_admin calls (kept apart from the
+# default executor used by EmailService and the SQLite stores)
+FCM_EXECUTOR_WORKERS = int(os.getenv("FCM_EXECUTOR_WORKERS", "8"))
+
+
+class FCMExecutor:
+    """
+    Bounded thread pool for blocking FCM SDK calls.
+
+    run() awaits a call on the pool with an optional timeout, so the event
+    loop never blocks on an FCM round trip and a burst of sends cannot take
+    over the threads other blocking work relies on. A timed-out call is
+    abandoned, not interrupted: its thread stays busy until the SDK returns.
+    Queue depth (calls waiting for a free thread) and wait times are kept
+    for /health.
+    """
+
+    def __init__(self, workers: int = FCM_EXECUTOR_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.counters = {"calls": 0, "timed_out": 0, "errors": 0, "max_queue_depth": 0}
+        self._started = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fcm")
+        return self._pool
+
+    def _call(self, submitted_at: float, fn: Callable, args: tuple) -> Any:
+        # Runs on a pool thread
+        waited = time.monotonic() - submitted_at
+        with self._lock:
+            self._started += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self.queued -= 1
+            self.running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None) -> Any:
+        """
+        Run fn(*args) on the FCM pool.
+
+        Args:
+            fn: Blocking callable, e.g. messaging.send_each
+            timeout: Seconds to wait (queueing included); None waits forever
+
+        Raises:
+            asyncio.TimeoutError: The call did not finish in time
+        """
+        self.counters["calls"] += 1
+        with self._lock:
+            self.queued += 1
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queued)
+        future = self._get_pool().submit(self._call, time.monotonic(), fn, args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.counters["timed_out"] += 1
+            if future.cancelled():
+                # Timed out while still queued: it never started, so never ran _call
+                with self._lock:
+                    self.queued -= 1
+            raise
+        except Exception:
+            self.counters["errors"] += 1
+            raise
+
+    def shutdown(self):
+        """Stop accepting calls (lifespan shutdown); in-flight SDK calls finish on their own."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queued,
+            "running": self.running,
+            **self.counters,
+            "avg_wait_ms": round(self._wait_total / self._started * 1000, 2) if self._started else 0.0,
+            "max_wait_ms": round(self._wait_max * 1000, 2)
+        }
+
+
+# Shared pool used by every FCM send
+fcm_executor = FCMExecutor()
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import jwt
+from firebase_admin import messaging
+from firebase_admin.exceptions import FirebaseError
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Sender used for reminder batches: "sdk" (firebase_admin send_each on the FCM
+# thread pool) or "http" (this module: async FCM HTTP v1 over HTTP/2)
+FCM_TRANSPORT = os.getenv("FCM_TRANSPORT", "sdk").lower()
+# Overridable so the client can be pointed at a local stub (benchmarks/bench_fcm_http.py)
+FCM_HTTP_BASE_URL = os.getenv("FCM_HTTP_BASE_URL", "https://fcm.googleapis.com").rstrip("/")
+FCM_OAUTH_TOKEN_URL = os.getenv("FCM_OAUTH_TOKEN_URL", "")
+FCM_HTTP_CONCURRENCY = int(os.getenv("FCM_HTTP_CONCURRENCY", "200"))
+FCM_HTTP_MAX_CONNECTIONS = int(os.getenv("FCM_HTTP_MAX_CONNECTIONS", "4"))
+FCM_HTTP_TIMEOUT = float(os.getenv("FCM_HTTP_TIMEOUT", "10"))
+# Refresh the access token this long before it expires, in the background
+FCM_TOKEN_REFRESH_MARGIN_SECONDS = int(os.getenv("FCM_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+
+FCM_SCOPE = "https://www.googleapis.com/auth/firebase.messaging"
+DEFAULT_TOKEN_URL = "https://oauth2.googleapis.com/token"
+
+# FcmError codes in v1 error details, mapped to the SDK's exceptions so
+# callers handle both transports the same way
+_FCM_ERROR_TYPES = {
+    "UNREGISTERED": messaging.UnregisteredError,
+    "SENDER_ID_MISMATCH": messaging.SenderIdMismatchError,
+    "QUOTA_EXCEEDED": messaging.QuotaExceededError,
+    "THIRD_PARTY_AUTH_ERROR": messaging.ThirdPartyAuthError,
+    "APNS_AUTH_ERROR": messaging.ThirdPartyAuthError
+}
+
+
+def _fcm_error(response: httpx.Response) -> FirebaseError:
+    """Exception for a non-2xx FCM v1 response."""
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        error = {}
+    message = error.get("message") or f"FCM returned HTTP {response.status_code}"
+    for detail in error.get("details", []):
+        if detail.get("@type") == "type.googleapis.com/google.firebase.fcm.v1.FcmError":
+            error_type = _FCM_ERROR_TYPES.get(detail.get("errorCode"))
+            if error_type is not None:
+                return error_type(message, http_response=response)
+    return FirebaseError(error.get("status") or str(response.status_code), message, http_response=response)
+
+
+class FCMHttpClient:
+    """
+    Async FCM HTTP v1 sender on one pooled HTTP/2 client.
+
+    Each message is its own POST to messages:send, but the requests are
+    multiplexed as streams over a few HTTP/2 connections, with up to
+    FCM_HTTP_CONCURRENCY in flight, so a batch never ties up threads.
+    The OAuth access token comes from a service-account JWT grant, is
+    cached, and is refreshed in the background FCM_TOKEN_REFRESH_MARGIN_SECONDS
+    before expiry (sends keep using the current token meanwhile).
+
+    Args:
+        service_account: Parsed service-account JSON (FIREBASE_SERVICE_ACCOUNT when omitted)
+        base_url: FCM API origin
+        token_url: OAuth token endpoint (the service account's token_uri when empty)
+    """
+
+    def __init__(
+        self,
+        service_account: Optional[Dict] = None,
+        base_url: str = FCM_HTTP_BASE_URL,
+        token_url: str = FCM_OAUTH_TOKEN_URL,
+        concurrency: int = FCM_HTTP_CONCURRENCY
+    ):
+        self._service_account = service_account
+        self.base_url = base_url
+        self.token_url = token_url
+        self.concurrency = concurrency
+        self._http: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._access_token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.counters = {"sent": 0, "failed": 0, "timed_out": 0, "token_refreshes": 0, "token_failures": 0}
+
+    @property
+    def service_account(self) -> Dict:
+        if self._service_account is None:
+            service_account_json = os.getenv("FIREBASE_SERVICE_ACCOUNT")
+            if not service_account_json:
+                raise ValueError("FIREBASE_SERVICE_ACCOUNT environment variable is missing")
+            self._service_account = json.loads(service_account_json)
+        return self._service_account
+
+    @property
+    def send_url(self) -> str:
+        project_id = os.getenv("FCM_PROJECT_ID") or self.service_account["project_id"]
+        return f"{self.base_url}/v1/projects/{project_id}/messages:send"
+
+    def _client(self) -> httpx.AsyncClient:
+        """The shared HTTP/2 client, created on first use."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                http2=True,
+                # A plain-http base URL is a local stub: HTTP/2 with prior knowledge (h2c)
+                http1=not self.base_url.startswith("http://"),
+                limits=httpx.Limits(
+                    max_connections=FCM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=FCM_HTTP_MAX_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(FCM_HTTP_TIMEOUT)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._refresh_lock = asyncio.Lock()
+        return self._http
+
+    async def _refresh_token(self):
+        """Exchange a signed service-account JWT for an access token."""
+        account = self.service_account
+        token_url = self.token_url or account.get("token_uri") or DEFAULT_TOKEN_URL
+        now = int(time.time())
+        assertion = jwt.encode(
+            {"iss": account["client_email"], "scope": FCM_SCOPE, "aud": token_url, "iat": now, "exp": now + 3600},
+            account["private_key"],
+            algorithm="RS256",
+            headers={"kid": account["private_key_id"]} if account.get("private_key_id") else None
+        )
+        try:
+            response = await self._client().post(token_url, data={
+                "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+                "assertion": assertion
+            })
+            response.raise_for_status()
+            body = response.json()
+        except Exception:
+            self.counters["token_failures"] += 1
+            raise
+        self._access_token = body["access_token"]
+        self._expires_at = time.monotonic() + int(body.get("expires_in", 3600))
+        self.counters["token_refreshes"] += 1
+        logger.info(f"FCM access token refreshed (expires in {body.get('expires_in', 3600)}s)")
+
+    async def _refresh_in_background(self):
+        try:
+            async with self._refresh_lock:
+                if self._expires_at - time.monotonic() <= FCM_TOKEN_REFRESH_MARGIN_SECONDS:
+                    await self._refresh_token()
+        except Exception as e:
+            # The current token is still valid; the next send tries again
+            logger.warning(f"Background FCM access token refresh failed: {str(e)}")
+
+    async def access_token(self, force: bool = False) -> str:
+        """Cached access token; only blocks when there is none or it has expired."""
+        self._client()
+        remaining = self._expires_at - time.monotonic()
+        if not force and self._access_token and remaining > 0:
+            if remaining <= FCM_TOKEN_REFRESH_MARGIN_SECONDS and (self._refresh_task is None or self._refresh_task.done()):
+                self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+            return self._access_token
+
+        stale = self._access_token
+        async with self._refresh_lock:
+            # Another send may have refreshed it while we waited
+            if self._access_token == stale or self._expires_at <= time.monotonic():
+                await self._refresh_token()
+        return self._access_token
+
+    async def _post(self, payload: Dict) -> httpx.Response:
+        response = await self._client().post(
+            self.send_url,
+            json=payload,
+            headers={"Authorization": f"Bearer {await self.access_token()}"}
+        )
+        if response.status_code == 401:
+            # Token revoked or rotated early: refresh once and resend
+            token = await self.access_token(force=True)
+            response = await self._client().post(self.send_url, json=payload, headers={"Authorization": f"Bearer {token}"})
+        return response
+
+    async def send(self, message: messaging.Message, timeout: Optional[float] = None) -> Optional[Exception]:
+        """
+        Send one message.
+
+        Returns:
+            None on success, else the exception (FirebaseError subclasses as
+            raised by the SDK, asyncio.TimeoutError, or a transport error)
+        """
+        # Same JSON the SDK would send
+        payload = {"message": messaging._MessagingService.encode_message(message)}
+        self._client()
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                response = await asyncio.wait_for(self._post(payload), timeout=timeout)
+            except asyncio.TimeoutError as e:
+                self.counters["timed_out"] += 1
+                return e
+            except Exception as e:
+                self.counters["failed"] += 1
+                return e
+            finally:
+                self.in_flight -= 1
+        if response.is_success:
+            self.counters["sent"] += 1
+            return None
+        self.counters["failed"] += 1
+        return _fcm_error(response)
+
+    async def send_each(self, messages: List[messaging.Message], timeout: Optional[float] = None) -> List[Optional[Exception]]:
+        """Send messages concurrently; one entry per message, in order (see send())."""
+        return list(await asyncio.gather(*(self.send(message, timeout) for message in messages)))
+
+    async def close(self):
+        """Close the pooled connections (lifespan shutdown)."""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            "transport": FCM_TRANSPORT,
+            "in_flight": self.in_flight,
+            "token_valid_for_seconds": max(0, int(self._expires_at - time.monotonic())),
+            **self.counters
+        }
+
+
+# Shared client, used for reminder batches when FCM_TRANSPORT=http
+fcm_http_client = FCMHttpClient()
@@ -0,0 +1,169 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Delayed retries of failed FCM sends, drained by a background worker
+FCM_RETRY_MAX_ATTEMPTS = int(os.getenv("FCM_RETRY_MAX_ATTEMPTS", "3"))
+FCM_RETRY_BASE_DELAY = float(os.getenv("FCM_RETRY_BASE_DELAY", "1"))
+FCM_RETRY_MAX_DELAY = float(os.getenv("FCM_RETRY_MAX_DELAY", "30"))
+# A reminder retried later than this is stale ("starting in 10 minutes" is no longer true)
+FCM_RETRY_MAX_AGE_SECONDS = float(os.getenv("FCM_RETRY_MAX_AGE_SECONDS", "300"))
+FCM_RETRY_MAX_QUEUE = int(os.getenv("FCM_RETRY_MAX_QUEUE", "10000"))
+
+
+@dataclass
+class RetryItem:
+    payload: Any  # e.g. the token record the message was built for
+    message: Any
+    max_attempts: int
+    attempt: int = 1  # attempts made so far
+    first_failed_at: float = field(default_factory=time.monotonic)
+
+
+class RetryQueue:
+    """
+    Min-heap of failed sends keyed by next attempt time.
+
+    push() never waits: the worker task (started on first push) sleeps until
+    the earliest item is due, re-sends every due item in one batch and
+    reschedules transient failures with jittered exponential backoff. Items
+    past max attempts or FCM_RETRY_MAX_AGE_SECONDS are dropped.
+
+    Args:
+        send_batch: async (messages) -> [None on success, else exception] per message
+        on_result: async (payload, error) for final outcomes (success or permanent error)
+        is_retryable: (error) -> bool
+        skip: optional (payload) -> bool; due items it matches are dropped unsent
+        on_batch_done: optional async () called after each retry batch
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[Any]], Awaitable[List[Optional[Exception]]]],
+        on_result: Callable[[Any, Optional[Exception]], Awaitable[None]],
+        is_retryable: Callable[[Exception], bool],
+        max_age: float = FCM_RETRY_MAX_AGE_SECONDS,
+        max_size: int = FCM_RETRY_MAX_QUEUE,
+        skip: Optional[Callable[[Any], bool]] = None,
+        on_batch_done: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        self.send_batch = send_batch
+        self.on_result = on_result
+        self.is_retryable = is_retryable
+        self.skip = skip
+        self.on_batch_done = on_batch_done
+        self.max_age = max_age
+        self.max_size = max_size
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"queued": 0, "succeeded": 0, "failed": 0, "dropped_stale": 0, "dropped_exhausted": 0, "dropped_full": 0, "dropped_skipped": 0}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Equal-jitter exponential backoff for the retry after `attempt` attempts."""
+        delay = min(FCM_RETRY_MAX_DELAY, FCM_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _schedule(self, item: RetryItem):
+        heapq.heappush(self._heap, (time.monotonic() + self.backoff(item.attempt), next(self._seq), item))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def push(self, payload: Any, message: Any, max_attempts: int = FCM_RETRY_MAX_ATTEMPTS):
+        """Queue a send that failed once; returns immediately."""
+        if max_attempts <= 1:
+            self.counters["dropped_exhausted"] += 1
+            return
+        if len(self._heap) >= self.max_size:
+            self.counters["dropped_full"] += 1
+            logger.warning("FCM retry queue is full; dropping a failed send")
+            return
+        self.counters["queued"] += 1
+        self._schedule(RetryItem(payload, message, max_attempts))
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _pop_due(self) -> List[RetryItem]:
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            item = heapq.heappop(self._heap)[2]
+            if now - item.first_failed_at > self.max_age:
+                self.counters["dropped_stale"] += 1
+                continue
+            if self.skip is not None and self.skip(item.payload):
+                self.counters["dropped_skipped"] += 1
+                continue
+            due.append(item)
+        return due
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            due = self._pop_due()
+            if due:
+                await self._retry(due)
+                continue
+            timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _retry(self, items: List[RetryItem]):
+        try:
+            errors = await self.send_batch([item.message for item in items])
+        except Exception as e:
+            errors = [e] * len(items)
+
+        for item, error in zip(items, errors):
+            item.attempt += 1
+            if error is not None and self.is_retryable(error):
+                if item.attempt >= item.max_attempts:
+                    self.counters["dropped_exhausted"] += 1
+                    logger.error(f"FCM send dropped after {item.attempt} attempts: {str(error)}")
+                else:
+                    self._schedule(item)
+                continue
+            self.counters["succeeded" if error is None else "failed"] += 1
+            try:
+                await self.on_result(item.payload, error)
+            except Exception as e:
+                logger.error(f"FCM retry result handler failed: {str(e)}")
+
+        if self.on_batch_done is not None:
+            try:
+                await self.on_batch_done()
+            except Exception as e:
+                logger.error(f"FCM retry batch handler failed: {str(e)}")
+
+    async def stop(self):
+        """Cancel the worker; queued retries are dropped (lifespan shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._heap:
+            logger.info(f"Dropping {len(self._heap)} queued FCM retries at shutdown")
+        self._heap.clear()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._heap), **self.counters}
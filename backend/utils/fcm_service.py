@@ -1,12 +1,18 @@
 import logging
 import os
 import json
-import time
+import hashlib
+import uuid
 import asyncio  
-from typing import List, Dict, Optional
+from typing import Iterable, List, Dict, Optional
 from firebase_admin import initialize_app, messaging, credentials
-from firebase_admin.exceptions import FirebaseError
 from utils.supabase_client import supabase
+from utils.cache import TTLCache
+from utils.fcm_retry import RetryQueue, FCM_RETRY_MAX_ATTEMPTS
+from utils.token_usage import last_used_buffer
+from utils.fcm_executor import fcm_executor
+from utils.fcm_http import fcm_http_client, FCM_TRANSPORT
+from utils.notification_dedup import mark_notified
 
 # Set up module-level logger
 logger = logging.getLogger(__name__)
@@ -14,6 +20,31 @@ logger = logging.getLogger(__name__)
 # Firebase Admin SDK initialization
 _firebase_app = None
 
+# send_each accepts at most 500 messages per call
+FCM_BATCH_SIZE = int(os.getenv("FCM_BATCH_SIZE", "500"))
+FCM_BATCH_CONCURRENCY = int(os.getenv("FCM_BATCH_CONCURRENCY", "4"))
+
+# Cap on each send_each call made by the retry worker
+FCM_RETRY_SEND_TIMEOUT = float(os.getenv("FCM_RETRY_SEND_TIMEOUT", "15"))
+
+# Bulk token lookup: users per in_() query, and only the columns sends need
+FCM_TOKEN_LOOKUP_CHUNK = int(os.getenv("FCM_TOKEN_LOOKUP_CHUNK", "200"))
+FCM_SEND_COLUMNS = "user_id, token, device_id"
+
+# Digest notifications: task order and how many task names the body lists
+REMINDER_PRIORITY_RANK = {"High": 0, "Medium": 1, "Low": 2}
+REMINDER_DIGEST_MAX_LISTED = int(os.getenv("REMINDER_DIGEST_MAX_LISTED", "3"))
+
+# Per-message errors that mean the token will never work again
+INVALID_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
+# Rejected tokens: skipped by later sends in memory, deactivated in bulk
+# (tokens per in_() update) at the end of each send pass
+FCM_INVALID_TOKEN_CHUNK = int(os.getenv("FCM_INVALID_TOKEN_CHUNK", "200"))
+FCM_INVALID_TOKEN_TTL_SECONDS = int(os.getenv("FCM_INVALID_TOKEN_TTL_SECONDS", "3600"))
+_denied_tokens = TTLCache(maxsize=10000, ttl=FCM_INVALID_TOKEN_TTL_SECONDS, name="denied_fcm_tokens")
+_pending_deactivation = set()
+
 def initialize_firebase():
     """
     Initialize Firebase Admin SDK with service account credentials.
@@ -51,64 +82,201 @@ def get_firebase_app():
         return initialize_firebase()
     return _firebase_app
 
-async def send_notification_to_token(
-    token: str, 
-    title: str, 
-    body: str, 
+def build_data_message(
+    token: str,
+    title: str,
+    body: str,
     data: Optional[Dict[str, str]] = None
-) -> bool:
+) -> messaging.Message:
+    """
+    Build the data-only FCM message used for every push.
+
+    CRITICAL: data-only payload (no notification block) prevents browser
+    auto-notifications; the service worker renders it.
+
+    The service worker uses data["tag"] as the notification tag, and a new
+    notification replaces any shown one with the same tag. Reminders set a
+    per-task (or per-digest) tag; other messages get a unique one.
+    """
+    message_data = dict(data or {})
+    message_data.update({"title": title, "body": body})
+    if not message_data.get("tag"):
+        task_id = message_data.get("task_id")
+        message_data["tag"] = f"task-{task_id}" if task_id else f"notification-{uuid.uuid4().hex}"
+    return messaging.Message(data=message_data, token=token)
+
+async def get_active_tokens_for_users(user_ids: List[str]) -> Dict[str, List[Dict]]:
+    """
+    Active FCM tokens for many users in a few chunked in_() queries.
+
+    Only the columns the sender needs are selected, a token registered
+    under several rows for the same user (re-registration from the same
+    browser) is kept once, and tokens FCM rejected recently are skipped
+    even if their deactivation has not been written yet.
+
+    Returns:
+        Dict of user_id -> [{"token": ..., "device_id": ...}] (users without
+        tokens, or whose chunk failed to load, are missing)
+    """
+    tokens_by_user: Dict[str, List[Dict]] = {}
+    seen = set()
+    unique_ids = list(dict.fromkeys(user_ids))
+
+    for i in range(0, len(unique_ids), FCM_TOKEN_LOOKUP_CHUNK):
+        chunk = unique_ids[i:i + FCM_TOKEN_LOOKUP_CHUNK]
+        try:
+            tokens_response = await supabase.table("fcm_tokens").select(FCM_SEND_COLUMNS).in_("user_id", chunk).eq("is_active", True).execute()
+        except Exception as e:
+            logger.error(f"Supabase error fetching tokens for {len(chunk)} users: {str(e)}")
+            continue
+
+        for row in tokens_response.data or []:
+            key = (row["user_id"], row["token"])
+            if key in seen or row["token"] in _denied_tokens:
+                continue
+            seen.add(key)
+            tokens_by_user.setdefault(row["user_id"], []).append(
+                {"token": row["token"], "device_id": row["device_id"]}
+            )
+
+    return tokens_by_user
+
+async def _send_each_chunked(
+    messages: List[messaging.Message],
+    timeout: Optional[float] = None
+) -> List[Optional[Exception]]:
+    """
+    Send messages with messaging.send_each, FCM_BATCH_SIZE per call, or with
+    the async HTTP v1 client when FCM_TRANSPORT=http.
+
+    Returns:
+        One entry per message, in order: None on success, else the exception
+        (a whole-chunk failure or timeout is reported for every message in it)
     """
-    Send a push notification to a single FCM token.
+    if FCM_TRANSPORT == "http":
+        # Requests are multiplexed over HTTP/2; the client bounds concurrency itself
+        return await fcm_http_client.send_each(messages, timeout)
+
+    semaphore = asyncio.Semaphore(FCM_BATCH_CONCURRENCY)
+
+    async def send_chunk(chunk: List[messaging.Message]) -> List[Optional[Exception]]:
+        async with semaphore:
+            try:
+                batch = await fcm_executor.run(messaging.send_each, chunk, timeout=timeout)
+            except Exception as e:
+                logger.error(f"FCM send_each of {len(chunk)} messages failed: {type(e).__name__}: {str(e)}")
+                return [e] * len(chunk)
+            return [None if response.success else response.exception for response in batch.responses]
+
+    chunks = [messages[i:i + FCM_BATCH_SIZE] for i in range(0, len(messages), FCM_BATCH_SIZE)]
+    outcomes = await asyncio.gather(*(send_chunk(chunk) for chunk in chunks))
+    return [outcome for chunk_outcomes in outcomes for outcome in chunk_outcomes]
+
+async def _handle_send_result(token_record: Dict, error: Optional[Exception]):
+    """Bookkeeping for a final send outcome (first pass or retry)."""
+    if error is None:
+        await update_token_last_used(token_record["device_id"])
+    elif isinstance(error, INVALID_TOKEN_ERRORS):
+        logger.warning(f"FCM token rejected ({type(error).__name__}): {token_record['token'][:20]}...")
+        # Deactivated by the flush at the end of the pass
+        deny_token(token_record["token"])
+    else:
+        logger.error(f"FCM send to device {token_record['device_id']} failed: {str(error)}")
+
+async def _handle_retry_result(payload: tuple, error: Optional[Exception]):
+    """Final outcome of a queued retry; payload is (token_record, tasks)."""
+    token_record, tasks = payload
+    await _handle_send_result(token_record, error)
+    if error is None and tasks:
+        # The first pass reported these tasks as failed, so nothing marked them yet
+        await mark_notified(tasks)
+
+def _is_retryable(error: Exception) -> bool:
+    return not isinstance(error, INVALID_TOKEN_ERRORS + (asyncio.TimeoutError,))
+
+# Failed sends are retried here, off the dispatch path
+retry_queue = RetryQueue(
+    send_batch=lambda messages: _send_each_chunked(messages, FCM_RETRY_SEND_TIMEOUT),
+    on_result=_handle_retry_result,
+    is_retryable=_is_retryable,
+    skip=lambda payload: payload[0]["token"] in _denied_tokens,
+    on_batch_done=lambda: flush_invalid_tokens()
+)
+
+async def send_notifications_batched(
+    notifications: List[Dict],
+    timeout: Optional[float] = None,
+    max_retries: int = FCM_RETRY_MAX_ATTEMPTS
+) -> List[Dict[str, int]]:
+    """
+    Send many notifications (any mix of users) through batched send_each calls.
+
+    Every (notification, device token) pair becomes one message, and all of
+    them are packed into send_each calls of up to FCM_BATCH_SIZE, so a whole
+    reminder tick costs a handful of FCM calls. Per-message responses are
+    mapped back to their token: unregistered / sender-mismatch tokens are
+    skipped for the rest of the pass and deactivated together at its end, other failures go to the background retry queue (this call
+    never sleeps on them). Timed-out messages are not retried, since they
+    may have been delivered.
     
     Args:
-        token: FCM registration token
-        title: Notification title
-        body: Notification body text
-        data: Optional data payload
+        notifications: Dicts with keys user_id, title, body and optional data
+            and tasks (task rows marked notified if a queued retry succeeds)
+        timeout: Seconds allowed per send_each call
+        max_retries: Total send attempts for transient failures
     
     Returns:
-        bool: True if sent successfully, False otherwise
+        Per-notification counts for this pass, in input order ("retrying" is
+        the part of "failed" handed to the retry queue):
+        {"sent": 2, "failed": 1, "invalid_tokens": 1, "timed_out": 0, "retrying": 1}
     """
-    try:
-        # Ensure Firebase is initialized
-        get_firebase_app()
-        
-        # CRITICAL: Send data-only payload to prevent browser auto-notifications
-        message_data = data or {}
-        message_data.update({
-            "title": title,
-            "body": body,
-            "tag": f"task-{int(time.time())}"
-        })
-        
-        # Create message with ONLY data payload (no notification block)
-        message = messaging.Message(
-            data=message_data,  # Only data, no notification block
-            token=token
-        )
-        
-        # Send message
-        response = messaging.send(message)
-        logger.info(f"FCM notification sent successfully to token {token[:20]}... Response: {response}")
-        return True
-        
-    except messaging.UnregisteredError:
-        logger.warning(f"FCM token is unregistered: {token[:20]}...")
-        await mark_token_as_invalid(token)
-        return False
-        
-    except messaging.SenderIdMismatchError:
-        logger.error(f"FCM sender ID mismatch for token: {token[:20]}...")
-        await mark_token_as_invalid(token)
-        return False
-        
-    except FirebaseError as e:
-        logger.error(f"FCM send failed for token {token[:20]}...: {str(e)}")
-        return False
-        
-    except Exception as e:
-        logger.error(f"Unexpected error sending FCM to token {token[:20]}...: {str(e)}")
-        return False
+    results = [{"sent": 0, "failed": 0, "invalid_tokens": 0, "timed_out": 0, "retrying": 0} for _ in notifications]
+    if not notifications:
+        return results
+
+    # Ensure Firebase is initialized
+    get_firebase_app()
+
+    # Resolve tokens for every user of the call in bulk
+    tokens_by_user = await get_active_tokens_for_users([notification["user_id"] for notification in notifications])
+
+    # One message per (notification, token)
+    pending = []
+    for index, notification in enumerate(notifications):
+        for token_record in tokens_by_user.get(notification["user_id"], []):
+            message = build_data_message(
+                token_record["token"], notification["title"], notification["body"], notification.get("data")
+            )
+            pending.append((index, token_record, message))
+
+    outcomes = await _send_each_chunked([message for _, _, message in pending], timeout)
+    for (index, token_record, message), error in zip(pending, outcomes):
+        if error is None:
+            results[index]["sent"] += 1
+        elif isinstance(error, INVALID_TOKEN_ERRORS):
+            results[index]["invalid_tokens"] += 1
+        else:
+            results[index]["failed"] += 1
+            if isinstance(error, asyncio.TimeoutError):
+                results[index]["timed_out"] += 1
+            else:
+                # Retried later by the queue worker; this pass does not wait for it
+                results[index]["retrying"] += 1
+                retry_queue.push(
+                    (token_record, notifications[index].get("tasks")), message, max_attempts=max_retries
+                )
+                continue
+        await _handle_send_result(token_record, error)
+
+    # Every token rejected in this pass, in a few bulk updates
+    await flush_invalid_tokens()
+
+    logger.info(
+        f"FCM batched send of {len(notifications)} notifications completed: "
+        f"{sum(r['sent'] for r in results)} sent, {sum(r['failed'] for r in results)} failed, "
+        f"{sum(r['invalid_tokens'] for r in results)} invalid tokens"
+    )
+    return results
 
 async def send_notification_to_user(
     user_id: str, 
@@ -131,44 +299,13 @@ async def send_notification_to_user(
         Dict with success/failure counts: {"sent": 2, "failed": 1, "invalid_tokens": 1}
     """
     try:
-        # Get all active FCM tokens for user
-        try:
-            tokens_response = supabase.table("fcm_tokens").select("*").eq("user_id", user_id).eq("is_active", True).execute()
-        except Exception as e:
-            logger.error(f"Supabase error fetching tokens for user {user_id}: {str(e)}")
-            return {"sent": 0, "failed": 0, "invalid_tokens": 0}
+        notification = {"user_id": user_id, "title": title, "body": body, "data": data}
+        results = (await send_notifications_batched([notification], max_retries=max_retries))[0]
+        results.pop("timed_out")
+        results.pop("retrying")
         
-        # Check if no tokens found
-        if not tokens_response.data:
+        if not any(results.values()):
             logger.info(f"No active FCM tokens found for user {user_id}")
-            return {"sent": 0, "failed": 0, "invalid_tokens": 0}
-        
-        results = {"sent": 0, "failed": 0, "invalid_tokens": 0}
-        
-        # Send to each token with retry logic
-        for token_record in tokens_response.data:
-            token = token_record["token"]
-            device_id = token_record["device_id"]
-            
-            success = False
-            for attempt in range(max_retries):
-                if await send_notification_to_token(token, title, body, data):
-                    results["sent"] += 1
-                    success = True
-                    
-                    # Update last_used timestamp
-                    await update_token_last_used(device_id)
-                    break
-                else:
-                    if attempt < max_retries - 1:
-                        # Exponential backoff: 1s, 2s, 4s
-                        wait_time = 2 ** attempt
-                        logger.info(f"Retrying FCM send to {device_id} in {wait_time}s (attempt {attempt + 1}/{max_retries})")
-                        await asyncio.sleep(wait_time)  # Non-blocking sleep
-            
-            if not success:
-                results["failed"] += 1
-                logger.error(f"Failed to send FCM notification to device {device_id} after {max_retries} attempts")
         
         logger.info(f"FCM batch send to user {user_id} completed: {results}")
         return results
@@ -177,61 +314,52 @@ async def send_notification_to_user(
         logger.error(f"Error sending notifications to user {user_id}: {str(e)}")
         return {"sent": 0, "failed": 0, "invalid_tokens": 0}
 
-async def send_batch_notifications(notifications: List[Dict]) -> Dict[str, int]:
+def deny_token(token: str):
+    """Stop sending to a rejected token now and queue its deactivation."""
+    _denied_tokens.set(token, True)
+    _pending_deactivation.add(token)
+
+def allow_token(token: str):
+    """Lift the in-memory deny for a token that was registered again."""
+    _denied_tokens.pop(token)
+    _pending_deactivation.discard(token)
+
+async def deactivate_tokens(tokens: Iterable[str]) -> List[str]:
     """
-    Send multiple notifications efficiently.
-    
-    Args:
-        notifications: List of notification dicts with keys: user_id, title, body, data
-    
+    Mark FCM tokens inactive with chunked in_("token", [...]) updates.
+
     Returns:
-        Dict with total success/failure counts
+        Tokens whose update failed
     """
-    total_results = {"sent": 0, "failed": 0, "invalid_tokens": 0}
-    
-    try:
-        for notification in notifications:
-            user_id = notification.get("user_id")
-            title = notification.get("title")
-            body = notification.get("body")
-            data = notification.get("data")
-            
-            if not all([user_id, title, body]):
-                logger.warning(f"Skipping invalid notification: {notification}")
-                total_results["failed"] += 1
-                continue
-            
-            results = await send_notification_to_user(user_id, title, body, data)
-            
-            # Aggregate results
-            total_results["sent"] += results["sent"]
-            total_results["failed"] += results["failed"]
-            total_results["invalid_tokens"] += results["invalid_tokens"]
-        
-        logger.info(f"Batch FCM send completed: {total_results}")
-        return total_results
-        
-    except Exception as e:
-        logger.error(f"Error in batch FCM send: {str(e)}")
-        return total_results
+    tokens = list(dict.fromkeys(tokens))
+    failed = []
+    for i in range(0, len(tokens), FCM_INVALID_TOKEN_CHUNK):
+        chunk = tokens[i:i + FCM_INVALID_TOKEN_CHUNK]
+        try:
+            await supabase.table("fcm_tokens").update({"is_active": False}).in_("token", chunk).execute()
+        except Exception as e:
+            logger.error(f"Failed to mark {len(chunk)} FCM tokens as inactive: {str(e)}")
+            failed.extend(chunk)
+    if len(failed) < len(tokens):
+        logger.info(f"Marked {len(tokens) - len(failed)} FCM tokens as inactive")
+    return failed
 
-async def mark_token_as_invalid(token: str):
-    """Mark an FCM token as inactive due to being invalid/unregistered."""
-    try:
-        supabase.table("fcm_tokens").update({"is_active": False}).eq("token", token).execute()
-        logger.info(f"Marked FCM token as inactive: {token[:20]}...")
-    except Exception as e:
-        logger.error(f"Failed to mark token as inactive: {str(e)}")
+async def flush_invalid_tokens():
+    """Deactivate every token denied since the last flush (failures wait for the next one)."""
+    if not _pending_deactivation:
+        return
+    pending = list(_pending_deactivation)
+    _pending_deactivation.clear()
+    _pending_deactivation.update(await deactivate_tokens(pending))
 
 async def update_token_last_used(device_id: str):
-    """Update the last_used timestamp for an FCM token."""
-    try:
-        from datetime import datetime
-        supabase.table("fcm_tokens").update({
-            "last_used": datetime.utcnow().isoformat()
-        }).eq("device_id", device_id).execute()
-    except Exception as e:
-        logger.error(f"Failed to update token last_used for device {device_id}: {str(e)}")
+    """
+    Record the last_used timestamp for an FCM token.
+
+    Buffered and written in bulk by last_used_buffer (see utils/token_usage.py),
+    so a successful send never waits on a DB write.
+    """
+    last_used_buffer.record(device_id)
 
 async def cleanup_invalid_tokens() -> int:
     """
@@ -242,7 +370,7 @@ async def cleanup_invalid_tokens() -> int:
     """
     try:
         # Delete inactive tokens
-        result = supabase.table("fcm_tokens").delete().eq("is_active", False).execute()
+        result = await supabase.table("fcm_tokens").delete().eq("is_active", False).execute()
         
         count = len(result.data) if result.data else 0
         logger.info(f"Cleaned up {count} inactive FCM tokens")
@@ -252,29 +380,88 @@ async def cleanup_invalid_tokens() -> int:
         logger.error(f"Error cleaning up invalid tokens: {str(e)}")
         return 0
 
-# Task notification helper function
-async def send_task_reminder(user_id: str, task_name: str, priority: str, user_name: str = "you") -> bool:
+# Task notification helper functions
+def build_task_reminder(
+    user_id: str,
+    task_name: str,
+    priority: str,
+    user_name: str = "you",
+    task_id: Optional[str] = None
+) -> Dict:
     """
-    Send a task reminder notification to a user.
-    
-    Args:
-        user_id: User ID to send to
-        task_name: Name of the task
-        priority: Task priority
-        user_name: User's display name
+    Build the reminder notification for one task.
+
+    With a task_id the notification is tagged task-<id>, so reminders for
+    different tasks stack on the device and a resend of the same one
+    replaces it.
     
     Returns:
-        bool: True if sent to at least one device
+        Dict with user_id, title, body and data, as accepted by send_notifications_batched
     """
-    title = "Task Reminder"
-    body = f"Hey, {user_name}! {task_name} is starting in 10 minutes—let's do this!😊💪 Priority: {priority}"
-    
     data = {
         "type": "task_reminder",
         "task_name": task_name,
         "priority": priority,
         "user_name": user_name
     }
+    if task_id is not None:
+        # build_data_message tags it task-<id>
+        data["task_id"] = str(task_id)
+    return {
+        "user_id": user_id,
+        "title": "Task Reminder",
+        "body": f"Hey, {user_name}! {task_name} is starting in 10 minutes—let's do this!😊💪 Priority: {priority}",
+        "data": data
+    }
+
+def _reminder_order(task: Dict) -> tuple:
+    """Sort key for digests: priority (High first), then start time."""
+    priority = (task.get("priority") or "Medium").capitalize()
+    return (REMINDER_PRIORITY_RANK.get(priority, len(REMINDER_PRIORITY_RANK)), str(task.get("start_time") or ""))
+
+def build_task_digest(user_id: str, tasks: List[Dict], user_name: str = "you") -> Dict:
+    """
+    Build one notification covering all of a user's tasks due in the same run.
+
+    Tasks are listed by priority, then start time. A single task gets the
+    regular reminder. The data payload keeps task_name / priority of the
+    first task (what the foreground toast shows) plus the ids of every task.
+    
+    Args:
+        user_id: User ID to send to
+        tasks: Task rows with id, name, priority and start_time
+        user_name: User's display name
     
-    results = await send_notification_to_user(user_id, title, body, data)
-    return results["sent"] > 0
\ No newline at end of file
+    Returns:
+        Dict with user_id, title, body and data, as accepted by send_notifications_batched
+    """
+    ordered = sorted(tasks, key=_reminder_order)
+    first = ordered[0]
+    first_priority = first.get("priority") or "Medium"
+    if len(ordered) == 1:
+        return build_task_reminder(user_id, first["name"], first_priority, user_name, task_id=first.get("id"))
+
+    names = [task["name"] for task in ordered[:REMINDER_DIGEST_MAX_LISTED]]
+    listed = ", ".join(names)
+    if len(ordered) > len(names):
+        listed += f" and {len(ordered) - len(names)} more"
+    task_ids = [str(task["id"]) for task in ordered]
+    # Same tasks -> same tag, whatever order they were listed in
+    digest_id = hashlib.sha1(",".join(sorted(task_ids)).encode()).hexdigest()[:16]
+
+    return {
+        "user_id": user_id,
+        "title": f"{len(ordered)} Tasks Starting Soon",
+        "body": f"Hey, {user_name}! {len(ordered)} tasks are starting in 10 minutes: {listed}—let's do this!😊💪",
+        "data": {
+            "type": "task_digest",
+            # FCM data values must be strings
+            "task_ids": json.dumps(task_ids),
+            "tag": f"digest-{digest_id}",
+            "task_count": str(len(ordered)),
+            "task_name": first["name"],
+            "priority": first_priority,
+            "user_name": user_name
+        }
+    }
+
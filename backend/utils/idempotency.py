@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+from utils.cache import TTLCache, get_shared_store
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# How long a completed write can be replayed, and how many keys are kept in-process
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+_SHARED_KEY_PREFIX = "idempotency:"
+
+# key -> {"request_hash": str, "response": Any}
+_responses = TTLCache(maxsize=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS, name="idempotency")
+
+# key -> [lock, users], so concurrent retries of the same write run one at a time
+_locks: Dict[str, list] = {}
+
+
+def hash_request(payload: Any) -> str:
+    """Stable hash of a request payload (key order independent)."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _cache_key(user_id: str, scope: str, idempotency_key: str) -> str:
+    return hashlib.sha256(f"{user_id}|{scope}|{idempotency_key}".encode()).hexdigest()
+
+
+class IdempotencyGuard:
+    """
+    Async context manager that replays the stored response for a repeated write.
+
+    Usage:
+        async with IdempotencyGuard(user_id, "POST /tasks", key, payload) as guard:
+            if guard.replayed:
+                return guard.response
+            result = ...  # perform the write
+            guard.save(result)
+            return result
+
+    A repeat is the same user, scope and Idempotency-Key with the same request
+    hash. sync.js reuses `<localId>:<created_at>` for every update of a task,
+    so a different hash under a known key is treated as a new request (and
+    replaces the stored entry) instead of being rejected. Only successful
+    responses are saved, so a failed write can be retried for real.
+    Without an Idempotency-Key the guard does nothing.
+    """
+
+    def __init__(self, user_id: str, scope: str, idempotency_key: Optional[str], payload: Any = None):
+        self.key = _cache_key(user_id, scope, idempotency_key) if idempotency_key else None
+        self.request_hash = hash_request(payload)
+        self.replayed = False
+        self.response = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._to_save = None
+
+    async def __aenter__(self) -> "IdempotencyGuard":
+        if self.key is None:
+            return self
+
+        holder = _locks.setdefault(self.key, [asyncio.Lock(), 0])
+        holder[1] += 1
+        self._lock = holder[0]
+        try:
+            await self._lock.acquire()
+        except BaseException:
+            holder[1] -= 1
+            if holder[1] == 0:
+                del _locks[self.key]
+            raise
+
+        entry = _responses.get(self.key)
+        if entry is None:
+            entry = await _load_shared(self.key)
+            if entry is not None:
+                _responses.set(self.key, entry)
+
+        if entry is not None and entry["request_hash"] == self.request_hash:
+            self.replayed = True
+            self.response = entry["response"]
+            logger.info(f"Replaying stored response for idempotency key {self.key[:12]}")
+        return self
+
+    def save(self, response: Any):
+        """Remember the response to replay for repeats of this request."""
+        if self.key is not None:
+            self._to_save = {"request_hash": self.request_hash, "response": response}
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.key is None:
+            return False
+        try:
+            if exc_type is None and self._to_save is not None:
+                _responses.set(self.key, self._to_save)
+                await _store_shared(self.key, self._to_save)
+        finally:
+            self._lock.release()
+            holder = _locks[self.key]
+            holder[1] -= 1
+            if holder[1] == 0:
+                del _locks[self.key]
+        return False
+
+
+async def _load_shared(key: str) -> Optional[dict]:
+    store = get_shared_store()
+    if store is None:
+        return None
+    try:
+        raw = await store.get(_SHARED_KEY_PREFIX + key)
+        return json.loads(raw) if raw else None
+    except Exception as e:
+        logger.error(f"Shared idempotency lookup failed: {str(e)}")
+        return None
+
+
+async def _store_shared(key: str, entry: dict):
+    store = get_shared_store()
+    if store is None:
+        return
+    try:
+        await store.set(_SHARED_KEY_PREFIX + key, json.dumps(entry, default=str), ex=IDEMPOTENCY_TTL_SECONDS)
+    except Exception as e:
+        logger.error(f"Shared idempotency store failed: {str(e)}")
+
+
+def get_idempotency_stats() -> Dict[str, Any]:
+    """Cache counters for the idempotency layer."""
+    return {**_responses.stats(), "in_flight": len(_locks)}
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Optional
+import httpx
+import jwt
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Asymmetric signing keys (RS256/ES256) for Supabase access tokens
+JWKS_REFRESH_SECONDS = int(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_RETRY_SECONDS = int(os.getenv("JWKS_RETRY_SECONDS", "30"))
+JWKS_MIN_REFRESH_SECONDS = int(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", "5"))
+
+ASYMMETRIC_ALGORITHMS = {"RS256", "ES256"}
+
+
+def _jwks_url() -> Optional[str]:
+    """Explicit SUPABASE_JWKS_URL, else the project's well-known JWKS endpoint."""
+    url = os.getenv("SUPABASE_JWKS_URL")
+    if url:
+        return url
+    supabase_url = os.getenv("SUPABASE_URL")
+    return f"{supabase_url}/auth/v1/.well-known/jwks.json" if supabase_url else None
+
+
+def _max_age(cache_control: Optional[str]) -> Optional[int]:
+    """max-age from a Cache-Control header, if present."""
+    match = re.search(r"max-age=(\d+)", cache_control or "")
+    return int(match.group(1)) if match else None
+
+
+class JWKSCache:
+    """
+    Signing keys indexed by kid, kept current by a background task.
+
+    get_key() is a dict lookup and never does I/O. Keys are loaded from
+    SUPABASE_JWKS_FILE (offline/test environments) and/or fetched from the
+    JWKS URL at startup, then refreshed ahead of the server's Cache-Control
+    max-age. A failed refresh keeps the last good key set; an empty set
+    (HS256-only project) is a normal result. fetch_kid() handles an unknown
+    kid (key rotation): it has the refresher fetch at once and waits for
+    it, unless the last fetch is under JWKS_MIN_REFRESH_SECONDS old.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_fetch: Optional[asyncio.Future] = None
+        self._last_fetch = float("-inf")
+        self.refreshes = 0
+        self.failures = 0
+
+    def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        """Key for a token's kid (or the only key when the token has none)."""
+        key = self._keys.get(kid)
+        if key is None and kid is None and len(self._keys) == 1:
+            key = next(iter(self._keys.values()))
+        return key
+
+    async def fetch_kid(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        """
+        Key for a kid, refetching the JWKS right away if it is unknown.
+
+        Concurrent callers share one fetch. Returns None without fetching
+        when background refresh is off or the last fetch was too recent.
+        """
+        key = self.get_key(kid)
+        if key is not None or self._wakeup is None:
+            return key
+        if time.monotonic() - self._last_fetch < JWKS_MIN_REFRESH_SECONDS:
+            return None
+        if self._next_fetch is None:
+            self._next_fetch = asyncio.get_running_loop().create_future()
+        waiter = self._next_fetch
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=JWKS_FETCH_TIMEOUT + 1)
+        except asyncio.TimeoutError:
+            pass
+        return self.get_key(kid)
+
+    def load(self, jwks: dict, source: str) -> int:
+        """Replace the key set from a JWKS document; returns the number of usable keys."""
+        keys = {}
+        for entry in jwks.get("keys", []):
+            if entry.get("use", "sig") != "sig":
+                continue
+            try:
+                key = jwt.PyJWK(entry)
+            except jwt.PyJWTError as e:
+                logger.warning(f"Skipping JWKS key {entry.get('kid')} from {source}: {str(e)}")
+                continue
+            keys[entry.get("kid")] = key
+        if keys:
+            self._keys = keys  # swap in one assignment; readers never see a partial set
+            logger.info(f"Loaded {len(keys)} JWT signing key(s) from {source}")
+        return len(keys)
+
+    def load_file(self, path: str) -> int:
+        """Load a JWKS document from disk."""
+        try:
+            with open(path) as f:
+                return self.load(json.load(f), path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load JWKS file {path}: {str(e)}")
+            return 0
+
+    async def refresh(self, client: httpx.AsyncClient, url: str) -> Optional[int]:
+        """
+        Fetch the JWKS once.
+
+        Returns:
+            Seconds until the next refresh, or None if the fetch failed
+        """
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            jwks = response.json()
+            # {"keys": []} is what an HS256-only project serves; only a non-empty
+            # set without one usable key is an error
+            if not self.load(jwks, url) and jwks.get("keys"):
+                raise ValueError("no usable signing keys")
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"JWKS refresh from {url} failed: {str(e)}")
+            return None
+
+        self.refreshes += 1
+        max_age = _max_age(response.headers.get("cache-control"))
+        interval = JWKS_REFRESH_SECONDS if max_age is None else min(max_age, JWKS_REFRESH_SECONDS)
+        # Refresh a little before the server-side cache lifetime runs out
+        return max(int(interval * 0.8), JWKS_MIN_REFRESH_SECONDS)
+
+    async def _run(self, url: str):
+        async with httpx.AsyncClient(timeout=JWKS_FETCH_TIMEOUT) as client:
+            while True:
+                delay = await self.refresh(client, url)
+                self._last_fetch = time.monotonic()
+                if self._next_fetch is not None:
+                    # Release fetch_kid() callers waiting on this fetch
+                    self._next_fetch.set_result(None)
+                    self._next_fetch = None
+                if delay is None:
+                    delay = JWKS_RETRY_SECONDS
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    # Woken by an unknown kid: fetch now, unless the last fetch is too recent
+                    wait = JWKS_MIN_REFRESH_SECONDS - (time.monotonic() - self._last_fetch)
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def start(self):
+        """Load the fallback file, do the first fetch and start background refresh."""
+        path = os.getenv("SUPABASE_JWKS_FILE")
+        if path:
+            self.load_file(path)
+
+        url = _jwks_url()
+        if not url or os.getenv("JWKS_FETCH", "true").lower() != "true":
+            return
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(url))
+        # Give the first fetch a chance to land before requests arrive
+        for _ in range(int(JWKS_FETCH_TIMEOUT * 10)):
+            if self.refreshes or self.failures:
+                break
+            await asyncio.sleep(0.1)
+
+    async def stop(self):
+        """Cancel the background refresh task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._wakeup = None
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self._keys),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "background_refresh": self._task is not None and not self._task.done()
+        }
+
+
+# Shared key cache used by verify_token
+jwks_cache = JWKSCache()
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Set, Tuple
+from utils.cache import get_shared_store
+from utils.scheduler_leases import REMINDER_LEASE_BACKEND
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# "Already reminded" records that stop a task being pushed twice
+# Backend: "memory" (per process), "sqlite" (survives restarts; shared by
+# processes on one host) or "redis" (shared). With reminder leasing the store
+# must be shared: redis leases need redis, sqlite leases need sqlite or redis.
+NOTIFICATION_DEDUP_BACKEND = os.getenv("NOTIFICATION_DEDUP_BACKEND", "sqlite").lower()
+NOTIFICATION_DEDUP_DB = os.getenv("NOTIFICATION_DEDUP_DB", "notification_dedup.db")
+NOTIFICATION_DEDUP_WINDOW_SECONDS = int(os.getenv("NOTIFICATION_DEDUP_WINDOW_SECONDS", "600"))
+NOTIFICATION_DEDUP_BUCKET_SECONDS = int(os.getenv("NOTIFICATION_DEDUP_BUCKET_SECONDS", "60"))
+
+
+def dedup_key(task_id: str, user_id: str) -> bytes:
+    """Compact 16-byte key for a (task, user) reminder."""
+    return hashlib.blake2b(f"{task_id}|{user_id}".encode(), digest_size=16).digest()
+
+
+class BucketRing:
+    """
+    Keys grouped into time buckets on a fixed ring.
+
+    A key marked at time t lands in bucket t // bucket_seconds. Lookups only
+    check the buckets inside the window, and a bucket is emptied when the
+    ring wraps onto it, so expiry never scans the whole store.
+    """
+
+    def __init__(self, window: float, bucket_seconds: float):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        # One spare bucket so the oldest in-window bucket is never overwritten
+        self.size = int(window // bucket_seconds) + 2
+        self._buckets: List[Tuple[int, Set[bytes]]] = [(-1, set()) for _ in range(self.size)]
+
+    def _bucket(self, epoch: int) -> Set[bytes]:
+        slot = epoch % self.size
+        bucket_epoch, keys = self._buckets[slot]
+        if bucket_epoch != epoch:
+            # Stale bucket from a previous lap: drop it wholesale
+            keys = set()
+            self._buckets[slot] = (epoch, keys)
+        return keys
+
+    def add(self, key: bytes, at: float):
+        self._bucket(int(at // self.bucket_seconds)).add(key)
+
+    def contains(self, key: bytes, now: float) -> bool:
+        newest = int(now // self.bucket_seconds)
+        oldest = int((now - self.window) // self.bucket_seconds)
+        for epoch in range(newest, oldest - 1, -1):
+            bucket_epoch, keys = self._buckets[epoch % self.size]
+            if bucket_epoch == epoch and key in keys:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return sum(len(keys) for _, keys in self._buckets)
+
+
+class MemoryDedupStore:
+    """Per-process store (lost on restart)."""
+
+    name = "memory"
+
+    def __init__(self, window: float, bucket_seconds: float):
+        self.ring = BucketRing(window, bucket_seconds)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def seen(self, keys: Iterable[bytes]) -> Set[bytes]:
+        now = time.time()
+        return {key for key in keys if self.ring.contains(key, now)}
+
+    async def claim(self, keys: Iterable[bytes]) -> Set[bytes]:
+        """Record the keys not seen in the window; returns those (the ones to send)."""
+        now = time.time()
+        claimed = {key for key in keys if not self.ring.contains(key, now)}
+        for key in claimed:
+            self.ring.add(key, now)
+        return claimed
+
+    async def mark(self, keys: Iterable[bytes]):
+        now = time.time()
+        for key in keys:
+            self.ring.add(key, now)
+
+    def size(self) -> int:
+        return len(self.ring)
+
+
+class SQLiteDedupStore(MemoryDedupStore):
+    """
+    Ring in memory, written through to a SQLite (WAL) file.
+
+    open() reloads only the rows still inside the window (indexed on
+    sent_at), so a restart or deploy on the same disk does not re-send
+    reminders that just went out. claim() goes to the file: an INSERT OR
+    IGNORE per key in one BEGIN IMMEDIATE transaction, so when processes
+    on one host share the file (sqlite reminder leases) exactly one of
+    them claims each reminder. The ring only short-circuits keys this
+    process already holds.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str, window: float, bucket_seconds: float):
+        super().__init__(window, bucket_seconds)
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        # One connection, used from executor threads: one transaction at a time
+        self._lock = threading.Lock()
+
+    def _open(self) -> int:
+        # Explicit transactions; wait for other processes' claims instead of failing
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sent (key BLOB PRIMARY KEY, sent_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sent_sent_at_idx ON sent (sent_at)")
+        cutoff = time.time() - self.ring.window
+        conn.execute("DELETE FROM sent WHERE sent_at < ?", (cutoff,))
+        rows = conn.execute("SELECT key, sent_at FROM sent WHERE sent_at >= ?", (cutoff,)).fetchall()
+        for key, sent_at in rows:
+            self.ring.add(bytes(key), sent_at)
+        self._conn = conn
+        return len(rows)
+
+    def _write(self, keys: List[bytes], now: float):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("INSERT OR REPLACE INTO sent VALUES (?, ?)", [(key, now) for key in keys])
+                # Expired rows are found through the sent_at index, not a table scan
+                self._conn.execute("DELETE FROM sent WHERE sent_at < ?", (now - self.ring.window,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _claim(self, keys: List[bytes], now: float) -> Set[bytes]:
+        claimed = set()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expire first, so a key from an earlier window can be claimed again
+                self._conn.execute("DELETE FROM sent WHERE sent_at < ?", (now - self.ring.window,))
+                for key in keys:
+                    if self._conn.execute("INSERT OR IGNORE INTO sent VALUES (?, ?)", (key, now)).rowcount == 1:
+                        claimed.add(key)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return claimed
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        loaded = await loop.run_in_executor(None, self._open)
+        logger.info(f"Notification dedup store loaded {loaded} recent entries from {self.path}")
+
+    async def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def claim(self, keys: Iterable[bytes]) -> Set[bytes]:
+        now = time.time()
+        candidates = [key for key in keys if not self.ring.contains(key, now)]
+        if self._conn is None or not candidates:
+            return await super().claim(candidates)
+        loop = asyncio.get_running_loop()
+        try:
+            claimed = await loop.run_in_executor(None, self._claim, candidates, now)
+        except Exception as e:
+            # Fall back to this process's ring rather than dropping reminders
+            logger.error(f"Failed to claim {len(candidates)} notifications in {self.path}: {str(e)}")
+            return await super().claim(candidates)
+        for key in claimed:
+            self.ring.add(key, now)
+        return claimed
+
+    async def mark(self, keys: Iterable[bytes]):
+        keys = list(keys)
+        now = time.time()
+        for key in keys:
+            self.ring.add(key, now)
+        if self._conn is None or not keys:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, keys, now)
+        except Exception as e:
+            # The in-memory ring still has them; only restart survival is lost
+            logger.error(f"Failed to persist {len(keys)} notification dedup entries: {str(e)}")
+
+
+class RedisDedupStore:
+    """Keys with a TTL in the shared Redis store, seen by every process."""
+
+    name = "redis"
+    prefix = "reminded:"
+
+    def __init__(self, redis, window: float):
+        self.redis = redis
+        self.window = int(window)
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def seen(self, keys: Iterable[bytes]) -> Set[bytes]:
+        keys = list(keys)
+        if not keys:
+            return set()
+        values = await self.redis.mget([self.prefix + key.hex() for key in keys])
+        return {key for key, value in zip(keys, values) if value is not None}
+
+    async def claim(self, keys: Iterable[bytes]) -> Set[bytes]:
+        keys = list(keys)
+        if not keys:
+            return set()
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self.prefix + key.hex(), "1", ex=self.window, nx=True)
+        return {key for key, created in zip(keys, await pipe.execute()) if created}
+
+    async def mark(self, keys: Iterable[bytes]):
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self.prefix + key.hex(), "1", ex=self.window)
+        await pipe.execute()
+
+    def size(self) -> Optional[int]:
+        return None
+
+
+def _create_store():
+    window, bucket = NOTIFICATION_DEDUP_WINDOW_SECONDS, NOTIFICATION_DEDUP_BUCKET_SECONDS
+    backend = NOTIFICATION_DEDUP_BACKEND
+    # Shards move between replicas, and the new owner has to see what the
+    # old one already claimed
+    if REMINDER_LEASE_BACKEND == "redis" and backend != "redis":
+        logger.warning(f"NOTIFICATION_DEDUP_BACKEND={backend} ignored: redis reminder leases need the shared redis dedup store")
+        backend = "redis"
+    if backend == "redis":
+        redis = get_shared_store()
+        if redis is not None:
+            return RedisDedupStore(redis, window)
+        if REMINDER_LEASE_BACKEND == "redis":
+            raise ValueError("REMINDER_LEASE_BACKEND=redis but no shared store is available for notification dedup. Set REDIS_URL.")
+        logger.warning("NOTIFICATION_DEDUP_BACKEND=redis but no shared store is available; using sqlite")
+    if backend == "memory":
+        if not REMINDER_LEASE_BACKEND:
+            return MemoryDedupStore(window, bucket)
+        logger.warning("NOTIFICATION_DEDUP_BACKEND=memory ignored: reminder leasing needs a shared dedup store; using sqlite")
+    return SQLiteDedupStore(NOTIFICATION_DEDUP_DB, window, bucket)
+
+
+# Shared store used by the reminder job
+dedup_store = _create_store()
+
+
+async def claim_reminders(tasks: List[dict]) -> Tuple[List[dict], int]:
+    """
+    Claim the tasks' reminders before sending them.
+
+    A task reminded (or claimed by another process) within the dedup
+    window is dropped; the rest are recorded atomically, so two processes
+    checking the same window never both send one reminder.
+
+    Returns:
+        (tasks this run should send, number filtered out)
+    """
+    keys = [dedup_key(str(task["id"]), task["user_id"]) for task in tasks]
+    try:
+        claimed = await dedup_store.claim(keys)
+    except Exception as e:
+        logger.error(f"Notification dedup claim failed: {str(e)}")
+        claimed = set(keys)
+    remaining = [task for task, key in zip(tasks, keys) if key in claimed]
+    return remaining, len(tasks) - len(remaining)
+
+
+async def mark_notified(tasks: Iterable[dict]):
+    """Record that these tasks were reminded (refreshes their claim)."""
+    try:
+        await dedup_store.mark(dedup_key(str(task["id"]), task["user_id"]) for task in tasks)
+    except Exception as e:
+        logger.error(f"Notification dedup update failed: {str(e)}")
+
+
+def get_dedup_stats() -> dict:
+    return {
+        "backend": dedup_store.name,
+        "window_seconds": NOTIFICATION_DEDUP_WINDOW_SECONDS,
+        "entries": dedup_store.size()
+    }
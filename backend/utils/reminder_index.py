@@ -0,0 +1,185 @@
+import logging
+import os
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Union
+from utils.supabase_client import supabase
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Pending reminders held in memory so the per-minute check needs no DB reads
+REMINDER_INDEX_PAGE_SIZE = int(os.getenv("REMINDER_INDEX_PAGE_SIZE", "1000"))
+
+REMINDER_COLUMNS = "id, user_id, name, start_time, priority, created_at, completed"
+
+# Fields kept per indexed task (what the reminder job reads)
+_ENTRY_FIELDS = ("id", "user_id", "name", "start_time", "priority", "created_at")
+
+# Timing wheel: one slot per minute of the day (tasks recur daily on start_time)
+SLOTS_PER_DAY = 24 * 60
+
+
+def _second_of_day(value: Union[str, time, None]) -> Optional[int]:
+    """Seconds since midnight for a start_time ("HH:MM[:SS]" or time), or None."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = time.fromisoformat(value)
+        except ValueError:
+            return None
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+class ReminderIndex:
+    """
+    Timing wheel of incomplete tasks keyed by start_time.
+
+    Each of the 1440 slots holds the tasks starting in that minute, and a
+    task_id -> slot map makes upsert/remove O(1). due() only walks the slots
+    covering the requested window. The index is loaded once at startup and
+    kept current by the task routes (upsert/remove on every write) plus a
+    delta resync at the start of every reminder tick, for writes made
+    outside this process (other workers or replicas, supabase-js from the
+    frontend).
+    """
+
+    def __init__(self):
+        self._wheel: List[Dict[str, dict]] = [{} for _ in range(SLOTS_PER_DAY)]
+        self._slot_of: Dict[str, int] = {}
+        self.ready = False
+        self.watermark: Optional[datetime] = None
+        self.loads = 0
+        self.resyncs = 0
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def upsert(self, task: dict):
+        """Add, move or drop a task based on its current row."""
+        task_id = str(task["id"])
+        seconds = _second_of_day(task.get("start_time"))
+        if task.get("completed") or not task.get("user_id") or seconds is None:
+            self.remove(task_id)
+            return
+
+        entry = {field: task.get(field) for field in _ENTRY_FIELDS}
+        entry["id"] = task_id
+        entry["_second"] = seconds
+
+        slot = seconds // 60
+        previous = self._slot_of.get(task_id)
+        if previous is not None and previous != slot:
+            self._wheel[previous].pop(task_id, None)
+        self._wheel[slot][task_id] = entry
+        self._slot_of[task_id] = slot
+
+    def upsert_many(self, tasks: Iterable[dict]):
+        for task in tasks:
+            self.upsert(task)
+
+    def remove(self, task_id: str):
+        slot = self._slot_of.pop(str(task_id), None)
+        if slot is not None:
+            self._wheel[slot].pop(str(task_id), None)
+
+    def remove_many(self, task_ids: Iterable[str]):
+        for task_id in task_ids:
+            self.remove(task_id)
+
+    def due(self, start: datetime, end: datetime) -> List[dict]:
+        """
+        Tasks whose start_time falls in [start, end] (time of day, inclusive).
+
+        Handles windows that cross midnight. Returned dicts are copies without
+        internal fields, shaped like the rows of the old tasks query.
+        """
+        start_second = _second_of_day(start.time())
+        end_second = _second_of_day(end.time())
+        if start_second <= end_second:
+            ranges = [(start_second, end_second)]
+        else:
+            ranges = [(start_second, 86399), (0, end_second)]
+
+        due = []
+        for low, high in ranges:
+            for slot in range(low // 60, high // 60 + 1):
+                for entry in self._wheel[slot].values():
+                    if low <= entry["_second"] <= high:
+                        due.append({field: entry[field] for field in _ENTRY_FIELDS})
+        return due
+
+    async def _fetch_rows(self, table: str, columns: str, filters: List[tuple]) -> List[dict]:
+        """Keyset-paginate over a table (ordered by its id column) with (column, op, value) filters."""
+        id_column = "task_id" if table == "task_tombstones" else "id"
+        rows = []
+        last_id = None
+        while True:
+            query = supabase.table(table).select(columns)
+            for column, op, value in filters:
+                query = getattr(query, op)(column, value)
+            if last_id is not None:
+                query = query.gt(id_column, last_id)
+            result = await query.order(id_column).limit(REMINDER_INDEX_PAGE_SIZE).execute()
+            page = result.data or []
+            rows.extend(page)
+            if len(page) < REMINDER_INDEX_PAGE_SIZE:
+                return rows
+            last_id = page[-1][id_column]
+
+    async def load(self):
+        """Build the index from every incomplete task (one paginated scan)."""
+        started_at = datetime.now(timezone.utc)
+        rows = await self._fetch_rows("tasks", REMINDER_COLUMNS, [("completed", "eq", False)])
+
+        fresh = ReminderIndex()
+        fresh.upsert_many(rows)
+        # Swap in one step so the reminder job never sees a half-built wheel
+        self._wheel, self._slot_of = fresh._wheel, fresh._slot_of
+        self.watermark = started_at
+        self.ready = True
+        self.loads += 1
+        logger.info(f"Reminder index loaded with {len(self)} pending tasks")
+
+    async def resync(self):
+        """
+        Apply rows changed or deleted since the last load/resync.
+
+        Two range reads on updated_at / deleted_at (migration 004 indexes),
+        usually returning nothing, so it is cheap enough to run every tick.
+        """
+        if not self.ready:
+            await self.load()
+            return
+
+        started_at = datetime.now(timezone.utc)
+        # Small overlap so a commit racing the previous resync is not missed
+        since = (self.watermark - timedelta(seconds=5)).isoformat()
+        try:
+            changed = await self._fetch_rows("tasks", REMINDER_COLUMNS, [("updated_at", "gte", since)])
+            deleted = await self._fetch_rows("task_tombstones", "task_id", [("deleted_at", "gte", since)])
+        except Exception as e:
+            # e.g. migration 001 (updated_at/tombstones) not applied: reload instead
+            logger.warning(f"Reminder index delta resync failed, reloading: {str(e)}")
+            await self.load()
+            return
+
+        self.upsert_many(changed)
+        self.remove_many(row["task_id"] for row in deleted)
+        self.watermark = started_at
+        self.resyncs += 1
+        if changed or deleted:
+            logger.info(f"Reminder index resync: {len(changed)} changed, {len(deleted)} deleted")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "tasks": len(self),
+            "loads": self.loads,
+            "resyncs": self.resyncs,
+            "watermark": self.watermark.isoformat() if self.watermark else None
+        }
+
+
+# Shared index used by the reminder job and kept current by routes/tasks.py
+reminder_index = ReminderIndex()
@@ -0,0 +1,42 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+from fastapi.responses import JSONResponse
+
+# orjson is much faster than the stdlib encoder; fall back cleanly without it
+try:
+    from fastapi.responses import ORJSONResponse
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSONResponse = None
+    ORJSON_AVAILABLE = False
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Default response class for the app (orjson when installed)
+DefaultJSONResponse = ORJSONResponse if ORJSON_AVAILABLE else JSONResponse
+
+if not ORJSON_AVAILABLE:
+    logger.warning("orjson not installed; API responses use the slower stdlib JSON encoder")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content as compact JSON bytes (orjson when available)."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), default=str).encode()
+
+
+def json_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None):
+    """
+    Serialize content once and return it as a Response.
+
+    Returning a Response from a route skips FastAPI's response_model
+    validation and jsonable_encoder pass, which otherwise walk every row of
+    a large list before it is encoded. Rows from PostgREST are already
+    JSON-safe, so they can go straight to the encoder. Note that headers set
+    on an injected `response: Response` are not applied; pass them here.
+    """
+    return DefaultJSONResponse(content=content, status_code=status_code, headers=headers)
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import math
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import zlib
+from typing import Set
+from utils.cache import get_shared_store
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Reminder sharding across replicas (API processes / instances).
+# Backend: "" (single replica, owns every shard), "sqlite" (replicas on one
+# host sharing a lock file) or "redis" (replicas anywhere, via REDIS_URL).
+REMINDER_LEASE_BACKEND = os.getenv("REMINDER_LEASE_BACKEND", "").lower()
+REMINDER_LEASE_DB = os.getenv("REMINDER_LEASE_DB", "reminder_leases.db")
+REMINDER_SHARDS = int(os.getenv("REMINDER_SHARDS", "16"))
+REMINDER_LEASE_TTL_SECONDS = int(os.getenv("REMINDER_LEASE_TTL_SECONDS", "30"))
+# Heartbeat often enough that a lease is renewed several times per TTL
+REMINDER_LEASE_RENEW_SECONDS = max(1, REMINDER_LEASE_TTL_SECONDS // 3)
+
+
+def shard_for(user_id: str, shards: int = REMINDER_SHARDS) -> int:
+    """Stable shard of a user (same on every replica, unlike hash())."""
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def _fair_share(shards: int, replicas: int) -> int:
+    return math.ceil(shards / max(replicas, 1))
+
+
+class SQLiteLeaseStore:
+    """
+    Leases in a SQLite file shared by replicas on one host (and in tests).
+
+    A whole heartbeat runs in one BEGIN IMMEDIATE transaction, so replicas
+    see each other's leases atomically.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (shard INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS members (replica_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _heartbeat(self, replica_id: str, shards: int, ttl: float) -> Set[int]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT OR REPLACE INTO members VALUES (?, ?)", (replica_id, now + ttl))
+            conn.execute("DELETE FROM members WHERE expires_at < ?", (now,))
+            replicas = conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+            target = _fair_share(shards, replicas)
+
+            live = {
+                shard: owner for shard, owner in
+                conn.execute("SELECT shard, owner FROM leases WHERE expires_at >= ?", (now,))
+            }
+            mine = sorted(shard for shard, owner in live.items() if owner == replica_id and shard < shards)
+
+            # Give back shards above our share so new replicas can take them
+            for shard in mine[target:]:
+                conn.execute("DELETE FROM leases WHERE shard = ? AND owner = ?", (shard, replica_id))
+            mine = mine[:target]
+
+            for shard in range(shards):
+                if len(mine) >= target:
+                    break
+                if shard not in live:
+                    mine.append(shard)
+
+            conn.executemany(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                [(shard, replica_id, now + ttl) for shard in mine]
+            )
+            conn.execute("COMMIT")
+            return set(mine)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _release(self, replica_id: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM leases WHERE owner = ?", (replica_id,))
+            conn.execute("DELETE FROM members WHERE replica_id = ?", (replica_id,))
+        finally:
+            conn.close()
+
+    async def heartbeat(self, replica_id: str, shards: int, ttl: float) -> Set[int]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._heartbeat, replica_id, shards, ttl)
+
+    async def release(self, replica_id: str, shards: int):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._release, replica_id)
+
+
+# Compare-and-set scripts: only the owner may renew or drop a lease
+_RENEW_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('expire', KEYS[1], ARGV[2]) end return 0"
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+class RedisLeaseStore:
+    """Leases as SET NX EX keys in the shared Redis store, for multi-host deployments."""
+
+    name = "redis"
+    prefix = "reminder:"
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def _lease_key(self, shard: int) -> str:
+        return f"{self.prefix}lease:{shard}"
+
+    async def heartbeat(self, replica_id: str, shards: int, ttl: float) -> Set[int]:
+        now = time.time()
+        members = f"{self.prefix}members"
+        await self.redis.zadd(members, {replica_id: now + ttl})
+        await self.redis.zremrangebyscore(members, "-inf", now)
+        target = _fair_share(shards, await self.redis.zcard(members))
+
+        owners = await self.redis.mget([self._lease_key(shard) for shard in range(shards)])
+        mine = []
+        for shard, owner in enumerate(owners):
+            if owner == replica_id:
+                if len(mine) < target and await self.redis.eval(_RENEW_SCRIPT, 1, self._lease_key(shard), replica_id, int(ttl)):
+                    mine.append(shard)
+                else:
+                    await self.redis.eval(_RELEASE_SCRIPT, 1, self._lease_key(shard), replica_id)
+
+        for shard, owner in enumerate(owners):
+            if len(mine) >= target:
+                break
+            if owner is None and await self.redis.set(self._lease_key(shard), replica_id, nx=True, ex=int(ttl)):
+                mine.append(shard)
+        return set(mine)
+
+    async def release(self, replica_id: str, shards: int):
+        for shard in range(shards):
+            await self.redis.eval(_RELEASE_SCRIPT, 1, self._lease_key(shard), replica_id)
+        await self.redis.zrem(f"{self.prefix}members", replica_id)
+
+
+class ShardCoordinator:
+    """
+    Decides which users' reminders this replica sends.
+
+    Users are hashed into REMINDER_SHARDS shards. Each replica holds
+    renewable leases on about shards / replicas of them; a replica that
+    stops heartbeating loses its leases after the TTL and the survivors
+    pick them up. Ownership is also dropped locally once a lease could
+    have expired, so a stalled replica never overlaps a new owner.
+    Without a store (single replica) every shard is owned.
+    """
+
+    def __init__(self, store=None, shards: int = REMINDER_SHARDS, ttl: float = REMINDER_LEASE_TTL_SECONDS):
+        self.store = store
+        self.shards = shards
+        self.ttl = ttl
+        self.replica_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.owned: Set[int] = set(range(shards)) if store is None else set()
+        self.owned_until = math.inf if store is None else 0.0
+        self.heartbeats = 0
+        self.failures = 0
+
+    def owns_user(self, user_id: str) -> bool:
+        if time.monotonic() >= self.owned_until:
+            return False
+        return shard_for(user_id, self.shards) in self.owned
+
+    async def heartbeat(self):
+        """Renew, rebalance and acquire leases (scheduled every TTL/3)."""
+        if self.store is None:
+            return
+        started = time.monotonic()
+        try:
+            owned = await self.store.heartbeat(self.replica_id, self.shards, self.ttl)
+        except Exception as e:
+            self.failures += 1
+            logger.error(f"Reminder lease heartbeat failed: {str(e)}")
+            return
+        if owned != self.owned:
+            logger.info(f"Replica {self.replica_id} now owns {len(owned)}/{self.shards} reminder shards")
+        self.owned = owned
+        self.owned_until = started + self.ttl
+        self.heartbeats += 1
+
+    async def release(self):
+        """Give up every lease (lifespan shutdown) so others take over at once."""
+        if self.store is None:
+            return
+        try:
+            await self.store.release(self.replica_id, self.shards)
+        except Exception as e:
+            logger.error(f"Reminder lease release failed: {str(e)}")
+        self.owned = set()
+        self.owned_until = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.store.name if self.store else "none",
+            "replica_id": self.replica_id,
+            "owned_shards": sorted(self.owned),
+            "shards": self.shards,
+            "heartbeats": self.heartbeats,
+            "failures": self.failures
+        }
+
+
+def _create_coordinator() -> ShardCoordinator:
+    if REMINDER_LEASE_BACKEND == "sqlite":
+        return ShardCoordinator(SQLiteLeaseStore(REMINDER_LEASE_DB))
+    if REMINDER_LEASE_BACKEND == "redis":
+        store = get_shared_store()
+        if store is not None:
+            return ShardCoordinator(RedisLeaseStore(store))
+        logger.warning("REMINDER_LEASE_BACKEND=redis but no shared store is available; this replica sends every reminder")
+    return ShardCoordinator()
+
+
+# Shared coordinator used by the reminder job
+shard_coordinator = _create_coordinator()
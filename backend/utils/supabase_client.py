@@ -1,5 +1,7 @@
 import logging
-from supabase import create_client, Client
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 from dotenv import load_dotenv
 import os
 
@@ -23,9 +25,72 @@ SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("SUPABASE_URL or SUPABASE_KEY is missing. Check your .env or hosting environment variables.")
 
-# Basic info log 
+# Connection pool tuning for the shared PostgREST HTTP client
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+
+# Basic info log
 key_type = "service_role" if SUPABASE_KEY.startswith("eyJ") else "anon/public"
 logger.info(f"Supabase client initialized. URL: {SUPABASE_URL} | Key type: {key_type}")
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+class AsyncSupabaseData:
+    """
+    Async Supabase data access (PostgREST) on one shared, pooled HTTP client.
+
+    Queries are built exactly like the sync client and awaited:
+        result = await supabase.table("tasks").select("*").eq("user_id", user_id).execute()
+
+    open()/close() are called from the app lifespan; table() opens the pool
+    lazily if it is used outside the app (scripts, one-off jobs).
+    """
+
+    def __init__(self, url: str, key: str):
+        self.rest_url = f"{url}/rest/v1"
+        self.headers = {
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        }
+        self._http: httpx.AsyncClient = None
+        self._postgrest: AsyncPostgrestClient = None
+
+    def open(self):
+        """Create the pooled HTTP/2 client (idempotent)."""
+        if self._postgrest is not None:
+            return
+        self._http = httpx.AsyncClient(
+            http2=SUPABASE_HTTP2,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT),
+            follow_redirects=True
+        )
+        self._postgrest = AsyncPostgrestClient(self.rest_url, headers=self.headers, http_client=self._http)
+        logger.info(
+            f"Supabase connection pool opened (http2={SUPABASE_HTTP2}, max_connections={SUPABASE_MAX_CONNECTIONS})"
+        )
+
+    async def close(self):
+        """Close the pooled client and its connections."""
+        if self._http is not None:
+            await self._http.aclose()
+            logger.info("Supabase connection pool closed")
+        self._http = None
+        self._postgrest = None
+
+    def table(self, table_name: str):
+        """Start a query on a table (same builder API as the sync client)."""
+        if self._postgrest is None:
+            self.open()
+        return self._postgrest.from_(table_name)
+
+
+# Shared async data client
+supabase = AsyncSupabaseData(SUPABASE_URL, SUPABASE_KEY)
@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional
+from utils.cache import TTLCache, get_shared_store
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Read-through cache of each user's full task list (GET /tasks)
+TASK_CACHE_BACKEND = os.getenv("TASK_CACHE_BACKEND", "memory")  # "memory" or "redis"
+TASK_CACHE_TTL_SECONDS = int(os.getenv("TASK_CACHE_TTL_SECONDS", "60"))
+TASK_CACHE_SIZE = int(os.getenv("TASK_CACHE_SIZE", "1000"))
+
+_SHARED_KEY_PREFIX = "tasks:"
+
+
+class InProcessTaskCache:
+    """Task lists held in this process, LRU-evicted and TTL-bounded."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, name="tasks")
+
+    async def get(self, user_id: str) -> Optional[List[dict]]:
+        return self._cache.get(user_id)
+
+    async def set(self, user_id: str, tasks: List[dict]):
+        self._cache.set(user_id, tasks)
+
+    async def apply(self, user_id: str, upserted: Iterable[dict] = (), removed_ids: Iterable[str] = ()):
+        """Patch a cached list in place of a refetch (no-op if the user isn't cached)."""
+        cached = self._cache.peek(user_id)
+        if cached is None:
+            return
+        # Copy-on-write so a list already handed to a response is never mutated
+        tasks = {task["id"]: task for task in cached}
+        for task_id in removed_ids:
+            tasks.pop(str(task_id), None)
+        for task in upserted:
+            tasks[str(task["id"])] = task
+        self._cache.set(user_id, list(tasks.values()))
+
+    async def invalidate(self, user_id: str):
+        self._cache.pop(user_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._cache.stats(), "backend": self.name}
+
+
+class RedisTaskCache:
+    """
+    Task lists in the shared Redis store, for multi-worker deployments.
+
+    Writes invalidate the entry instead of patching it: a read-modify-write
+    from several processes could interleave and lose an update.
+    """
+
+    name = "redis"
+
+    def __init__(self, store, ttl: float):
+        self._store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, user_id: str) -> Optional[List[dict]]:
+        try:
+            raw = await self._store.get(_SHARED_KEY_PREFIX + user_id)
+        except Exception as e:
+            logger.error(f"Shared task cache read failed for user {user_id}: {str(e)}")
+            raw = None
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, user_id: str, tasks: List[dict]):
+        try:
+            await self._store.set(_SHARED_KEY_PREFIX + user_id, json.dumps(tasks, default=str), ex=int(self.ttl))
+        except Exception as e:
+            logger.error(f"Shared task cache write failed for user {user_id}: {str(e)}")
+
+    async def apply(self, user_id: str, upserted: Iterable[dict] = (), removed_ids: Iterable[str] = ()):
+        await self.invalidate(user_id)
+
+    async def invalidate(self, user_id: str):
+        try:
+            await self._store.delete(_SHARED_KEY_PREFIX + user_id)
+        except Exception as e:
+            logger.error(f"Shared task cache invalidation failed for user {user_id}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.name,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def _create_backend():
+    if TASK_CACHE_BACKEND == "redis":
+        store = get_shared_store()
+        if store is not None:
+            return RedisTaskCache(store, TASK_CACHE_TTL_SECONDS)
+        logger.warning("TASK_CACHE_BACKEND=redis but no shared store is available; using in-process task cache")
+    return InProcessTaskCache(TASK_CACHE_SIZE, TASK_CACHE_TTL_SECONDS)
+
+
+task_cache = _create_backend()
+
+
+async def get_cached_tasks(user_id: str) -> Optional[List[dict]]:
+    """Cached task list for a user, or None on a miss."""
+    return await task_cache.get(user_id)
+
+
+async def cache_tasks(user_id: str, tasks: List[dict]):
+    """Store a freshly fetched task list."""
+    await task_cache.set(user_id, tasks)
+
+
+async def cache_upsert_tasks(user_id: str, tasks: Iterable[dict]):
+    """Write-through for created/updated task rows."""
+    await task_cache.apply(user_id, upserted=tasks)
+
+
+async def cache_remove_tasks(user_id: str, task_ids: Iterable[str]):
+    """Write-through for deleted tasks."""
+    await task_cache.apply(user_id, removed_ids=task_ids)
+
+
+def get_task_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters for tuning TASK_CACHE_SIZE / TASK_CACHE_TTL_SECONDS."""
+    return task_cache.stats()
@@ -0,0 +1,131 @@
+import itertools
+import logging
+import os
+import secrets
+from typing import Optional
+from utils.cache import TTLCache, get_shared_store
+from utils.compression import strip_etag_encoding
+from utils.task_cache import TASK_CACHE_BACKEND
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Per-user task list versions behind the ETag on GET /tasks.
+#
+# Kept next to the task cache: in process for the memory backend, in the
+# shared store for TASK_CACHE_BACKEND=redis, so a write handled by one worker
+# changes the ETag every worker hands out. Versions are never reused (a
+# random per-process epoch in memory, one global sequence in Redis), so an
+# evicted or expired entry just misses and refetches. Entries expire after
+# TASK_VERSION_TTL_SECONDS, which bounds how long a write that bypasses the
+# API (the frontend also writes to Supabase directly) can keep a stale 304.
+TASK_VERSION_TTL_SECONDS = int(os.getenv("TASK_VERSION_TTL_SECONDS", "300"))
+TASK_VERSION_CACHE_SIZE = int(os.getenv("TASK_VERSION_CACHE_SIZE", "50000"))
+
+_SHARED_KEY_PREFIX = "taskver:"
+
+# Bump / read-or-mint a user's version from the global sequence, atomically
+_BUMP_SCRIPT = (
+    "local v = redis.call('incr', KEYS[1]) "
+    "redis.call('set', KEYS[2], v, 'EX', ARGV[1]) return v"
+)
+_GET_SCRIPT = (
+    "local v = redis.call('get', KEYS[2]) "
+    "if not v then v = redis.call('incr', KEYS[1]) redis.call('set', KEYS[2], v, 'EX', ARGV[1]) end "
+    "return v"
+)
+
+_EPOCH = secrets.token_hex(4)
+_counter = itertools.count(1)
+
+
+def _unique_version() -> str:
+    """A version no client can hold yet (forces a full response)."""
+    return f"{_EPOCH}-{next(_counter)}"
+
+
+class InProcessTaskVersions:
+    """Versions from one process-wide counter, prefixed with the process epoch."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._versions = TTLCache(maxsize=maxsize, ttl=ttl, name="task_versions")
+
+    async def get(self, user_id: str) -> str:
+        version = self._versions.get(user_id)
+        if version is None:
+            version = _unique_version()
+            self._versions.set(user_id, version)
+        return version
+
+    async def bump(self, user_id: str):
+        self._versions.set(user_id, _unique_version())
+
+
+class RedisTaskVersions:
+    """Versions in the shared Redis store, seen by every worker."""
+
+    name = "redis"
+
+    def __init__(self, store, ttl: float):
+        self._store = store
+        self.ttl = int(ttl)
+
+    def _keys(self, user_id: str) -> list:
+        return [f"{_SHARED_KEY_PREFIX}seq", _SHARED_KEY_PREFIX + user_id]
+
+    async def get(self, user_id: str) -> str:
+        try:
+            return str(await self._store.eval(_GET_SCRIPT, 2, *self._keys(user_id), self.ttl))
+        except Exception as e:
+            logger.error(f"Shared task version read failed for user {user_id}: {str(e)}")
+            return _unique_version()
+
+    async def bump(self, user_id: str):
+        try:
+            await self._store.eval(_BUMP_SCRIPT, 2, *self._keys(user_id), self.ttl)
+        except Exception as e:
+            logger.error(f"Shared task version bump failed for user {user_id}: {str(e)}")
+
+
+def _create_backend():
+    if TASK_CACHE_BACKEND == "redis":
+        store = get_shared_store()
+        if store is not None:
+            return RedisTaskVersions(store, TASK_VERSION_TTL_SECONDS)
+    return InProcessTaskVersions(TASK_VERSION_CACHE_SIZE, TASK_VERSION_TTL_SECONDS)
+
+
+task_versions = _create_backend()
+
+
+async def get_task_version(user_id: str) -> str:
+    """Current version of the user's task list, minting one if unknown."""
+    return await task_versions.get(user_id)
+
+
+async def bump_task_version(user_id: str):
+    """Invalidate the user's current version after a write."""
+    await task_versions.bump(user_id)
+
+
+def make_etag(version: str, variant: Optional[str] = None) -> str:
+    """Strong ETag for a version, optionally qualified by a representation variant."""
+    return f'"{version}.{variant}"' if variant else f'"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        # Validators handed out with a compressed body carry an encoding suffix
+        if strip_etag_encoding(candidate) == etag:
+            return True
+    return False
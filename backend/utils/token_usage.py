@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+from utils.supabase_client import supabase
+
+# Set up module-level logger
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer for fcm_tokens.last_used (bookkeeping only, so a few
+# seconds of lag are fine); flushed on an interval, on size and at shutdown
+FCM_LAST_USED_FLUSH_SECONDS = int(os.getenv("FCM_LAST_USED_FLUSH_SECONDS", "30"))
+FCM_LAST_USED_FLUSH_SIZE = int(os.getenv("FCM_LAST_USED_FLUSH_SIZE", "1000"))
+# Devices per bulk UPDATE ... in_("device_id", [...])
+FCM_LAST_USED_CHUNK = int(os.getenv("FCM_LAST_USED_CHUNK", "200"))
+
+
+class LastUsedBuffer:
+    """
+    Pending last_used timestamps, coalesced per device.
+
+    record() only touches a dict; repeated sends to a device between flushes
+    collapse into one entry. flush() writes one UPDATE per chunk of devices
+    with the newest timestamp of the chunk, so a stored last_used can be
+    early or late by at most one flush interval. Entries whose write fails
+    go back into the buffer for the next flush.
+    """
+
+    def __init__(self, flush_size: int = FCM_LAST_USED_FLUSH_SIZE, chunk_size: int = FCM_LAST_USED_CHUNK):
+        self.flush_size = flush_size
+        self.chunk_size = chunk_size
+        self._pending: Dict[str, datetime] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.counters = {"recorded": 0, "flushes": 0, "rows_written": 0, "write_failures": 0}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, device_id: str, used_at: Optional[datetime] = None):
+        """Note a successful send; starts a background flush once the buffer is full."""
+        self._pending[device_id] = used_at or datetime.utcnow()
+        self.counters["recorded"] += 1
+        if len(self._pending) >= self.flush_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def _write_chunk(self, chunk: Dict[str, datetime]):
+        try:
+            await supabase.table("fcm_tokens").update({
+                "last_used": max(chunk.values()).isoformat()
+            }).in_("device_id", list(chunk)).execute()
+        except Exception as e:
+            self.counters["write_failures"] += 1
+            logger.error(f"Failed to update last_used for {len(chunk)} devices: {str(e)}")
+            # Keep them for the next flush unless a newer send re-recorded the device
+            for device_id, used_at in chunk.items():
+                self._pending.setdefault(device_id, used_at)
+            return
+        self.counters["rows_written"] += len(chunk)
+
+    async def flush(self):
+        """Write every pending timestamp in chunked bulk updates."""
+        if not self._pending:
+            return
+        # Swap the buffer out so sends during the writes start a new one
+        pending, self._pending = self._pending, {}
+        device_ids = list(pending)
+        for i in range(0, len(device_ids), self.chunk_size):
+            await self._write_chunk({device_id: pending[device_id] for device_id in device_ids[i:i + self.chunk_size]})
+        self.counters["flushes"] += 1
+        logger.info(f"Flushed last_used for {len(pending)} FCM devices")
+
+    async def close(self):
+        """Final flush at lifespan shutdown."""
+        if self._flush_task is not None and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), **self.counters}
+
+
+# Shared buffer fed by fcm_service and flushed by the scheduler
+last_used_buffer = LastUsedBuffer()